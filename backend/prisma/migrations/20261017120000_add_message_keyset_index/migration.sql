@@ -0,0 +1,2 @@
+-- CreateIndex
+CREATE INDEX `tify_messages_created_at_id_idx` ON `tify_messages`(`created_at`, `id`);
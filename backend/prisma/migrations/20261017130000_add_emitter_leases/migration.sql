@@ -0,0 +1,23 @@
+-- CreateTable
+CREATE TABLE `tify_emitter_instances` (
+    `id` VARCHAR(191) NOT NULL,
+    `hostname` VARCHAR(191) NULL,
+    `started_at` DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    `heartbeat_at` DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+
+    INDEX `tify_emitter_instances_heartbeat_at_idx`(`heartbeat_at`),
+    PRIMARY KEY (`id`)
+) DEFAULT CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- CreateTable
+CREATE TABLE `tify_emitter_leases` (
+    `partition_id` INTEGER NOT NULL,
+    `owner` VARCHAR(191) NULL,
+    `expires_at` DATETIME(3) NULL,
+    `checkpoint_at` DATETIME(3) NULL,
+    `checkpoint_id` VARCHAR(191) NULL,
+    `updated_at` DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+
+    INDEX `tify_emitter_leases_owner_idx`(`owner`),
+    PRIMARY KEY (`partition_id`)
+) DEFAULT CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
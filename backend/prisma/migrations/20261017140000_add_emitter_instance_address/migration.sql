@@ -0,0 +1,2 @@
+-- AlterTable
+ALTER TABLE `tify_emitter_instances` ADD COLUMN `address` VARCHAR(191) NULL;
@@ -0,0 +1,996 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for event_emitter.py against local stand-ins.
+
+    python3 scripts/emitter_bench.py apns --tokens 20000 --concurrency 16 --latency-ms 5
+    python3 scripts/emitter_bench.py sse --subscribers 2000 --events 20
+    python3 scripts/emitter_bench.py webhook --events 5000 --batch-size 100
+    python3 scripts/emitter_bench.py journal --messages 100000
+    python3 scripts/emitter_bench.py e2e --channel-sizes 10,100,1000 --backlogs 0,1000 --messages 500
+    python3 scripts/emitter_bench.py e2e --channel-sizes 5 --backlogs 0 --messages 50 --wake --post --apns-latency-ms 100
+    python3 scripts/emitter_bench.py http --route events --connections 64 --requests 20000 --pipeline 4
+    python3 scripts/emitter_bench.py cluster --instances 1,2,4 --partitions 16 --messages 2000 --backlog 500
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import resource
+import selectors
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import event_emitter as emitter  # noqa: E402
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def _serve(handler_cls):
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), handler_cls)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+# --- Fake APNs -------------------------------------------------------------
+
+class FakeApnsError(Exception):
+    pass
+
+
+def _apns_error(reason):
+    # apns2 raises one exception class per reason; mimic the class name.
+    return type(reason, (FakeApnsError,), {})
+
+
+def fake_apns_server(latency_ms=0.0, error_rate=0.0):
+    received = {'notifications': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    class FakeApnsHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', '0'))
+            if length:
+                self.rfile.read(length)
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+            if error_rate and random.random() < error_rate:
+                status, body = 410, b'{"reason":"Unregistered"}'
+            elif not self.path.startswith('/3/device/'):
+                status, body = 400, b'{"reason":"BadPath"}'
+            else:
+                status, body = 200, b''
+            with lock:
+                received['notifications' if status == 200 else 'errors'] += 1
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    srv = _serve(FakeApnsHandler)
+    srv.received = received
+    return srv
+
+
+class FakeApnsClient:
+    """Speaks to the fake server with the ``send_notification`` signature of apns2."""
+
+    def __init__(self, host, port):
+        self._conn = http.client.HTTPConnection(host, port, timeout=10)
+
+    def send_notification(self, token, payload, topic=None, priority=None, expiration=None, collapse_id=None):
+        body = json.dumps(payload.dict() if hasattr(payload, 'dict') else payload).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'apns-topic': topic or ''}
+        if collapse_id:
+            headers['apns-collapse-id'] = collapse_id
+        self._conn.request('POST', f'/3/device/{token}', body=body, headers=headers)
+        resp = self._conn.getresponse()
+        data = resp.read()
+        if resp.status != 200:
+            reason = json.loads(data.decode('utf-8') or '{}').get('reason') or 'Unknown'
+            raise _apns_error(reason)(reason)
+
+
+def bench_apns(args):
+    srv = fake_apns_server(args.latency_ms, args.error_rate)
+    host, port = srv.server_address
+    fanout = emitter.ApnsFanout(lambda: FakeApnsClient(host, port), args.concurrency, args.batch_size)
+    tokens = [f'{i:064x}' for i in range(args.tokens)]
+    payload = {'aps': {'alert': {'title': 'Emergencia', 'body': 'bench'}, 'sound': 'default', 'badge': 1}}
+    # Warm up the connections so the measurement excludes connect time.
+    fanout.send(tokens[:args.concurrency], payload, 'bench.topic')
+    start = time.perf_counter()
+    results = fanout.send(tokens, payload, 'bench.topic')
+    elapsed = time.perf_counter() - start
+    srv.shutdown()
+    rate = len(results) / elapsed if elapsed else 0.0
+    print(json.dumps({
+        'tokens': len(tokens),
+        'concurrency': args.concurrency,
+        'latency_ms': args.latency_ms,
+        'elapsed_s': round(elapsed, 3),
+        'notifications_per_s': round(rate, 1),
+        'results': emitter.summarize_apns(results),
+    }))
+    if args.target and rate < args.target:
+        print(f'below target: {rate:.1f}/s < {args.target}/s', file=sys.stderr)
+        return 1
+    return 0
+
+
+# --- Fake webhook receiver ---------------------------------------------------
+
+def fake_webhook_server(latency_ms=0.0, error_rate=0.0):
+    received = {'posts': 0, 'events': 0}
+    lock = threading.Lock()
+
+    class FakeWebhookHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', '0'))
+            body = json.loads(self.rfile.read(length) or b'null')
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+            status = 503 if error_rate and random.random() < error_rate else 200
+            if status == 200:
+                with lock:
+                    received['posts'] += 1
+                    received['events'] += len(body) if isinstance(body, list) else 1
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    srv = _serve(FakeWebhookHandler)
+    srv.received = received
+    return srv
+
+
+def bench_webhook(args):
+    srv = fake_webhook_server(args.latency_ms, args.error_rate)
+    host, port = srv.server_address
+    spool = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.emitter', 'bench-dead-letter.jsonl')
+    sender = emitter.WebhookSender(f'http://{host}:{port}/hook', args.batch_size, args.flush_ms / 1000.0,
+                                   args.retries, 5, spool, args.concurrency)
+    per_worker = args.events // args.concurrency
+
+    def worker(n):
+        for i in range(per_worker):
+            sender.send({'type': 'emergency', 'id': f'{n}-{i}', 'channelId': 'bench', 'content': 'bench'})
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    sender.close()
+    elapsed = time.perf_counter() - start
+    srv.shutdown()
+    stats = sender.stats()
+    print(json.dumps({
+        'events': per_worker * args.concurrency,
+        'batch_size': args.batch_size,
+        'concurrency': args.concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'events_per_s': round(stats['events'] / elapsed, 1) if elapsed else 0.0,
+        'post_latency_ms': {k: round(v * 1000, 2) for k, v in stats['latencySeconds'].items()},
+        'received': srv.received,
+        'sender': stats,
+    }))
+    return 0
+
+
+# --- Delivery journal --------------------------------------------------------
+
+def bench_journal(args):
+    tmp = tempfile.mkdtemp(prefix='emitter-journal-')
+    path = os.path.join(tmp, 'journal.db')
+    journal = emitter.DeliveryJournal(path)
+    base = datetime(2025, 1, 1)
+    ids = [f'msg-{i:08d}' for i in range(args.messages)]
+
+    # Write path as the delivery workers run it: one delivered id plus a checkpoint
+    # advance per message.
+    start = time.perf_counter()
+    for i, mid in enumerate(ids):
+        journal.mark_delivered(mid)
+        journal.save_checkpoint((base + timedelta(milliseconds=i), mid))
+    write_s = time.perf_counter() - start
+    journal.close()
+
+    # Recovery: reopen, read the checkpoint and check the replay window for duplicates.
+    start = time.perf_counter()
+    journal = emitter.DeliveryJournal(path)
+    checkpoint = journal.load_checkpoint()
+    replay = ids[-args.replay:]
+    duplicates = sum(1 for mid in replay if journal.is_delivered(mid))
+    recovery_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    journal.retention_seconds = 0
+    journal.compact(force=True)
+    compact_s = time.perf_counter() - start
+    journal.close()
+    size = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp))
+    print(json.dumps({
+        'messages': args.messages,
+        'write_us_per_message': round(write_s / args.messages * 1e6, 1),
+        'recovery_ms': round(recovery_s * 1000, 2),
+        'replay_window': len(replay),
+        'duplicates_suppressed': duplicates,
+        'checkpoint': [checkpoint[0].isoformat(), checkpoint[1]] if checkpoint else None,
+        'compact_ms': round(compact_s * 1000, 2),
+        'size_after_compact_bytes': size,
+    }))
+    for f in os.listdir(tmp):
+        os.remove(os.path.join(tmp, f))
+    os.rmdir(tmp)
+    return 0
+
+
+# --- SSE fan-out -------------------------------------------------------------
+
+def _raise_fd_limit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+def bench_sse(args):
+    _raise_fd_limit(args.subscribers * 2 + 256)
+    emitter.Handler.log_message = lambda *a: None
+    emitter.EVENT_HUB.max_subscribers = max(emitter.EVENT_HUB.max_subscribers, args.subscribers)
+    srv = emitter.EmitterHTTPServer(('127.0.0.1', 0), emitter.Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    emitter.EVENT_HUB.start()
+    port = srv.server_address[1]
+
+    sel = selectors.DefaultSelector()
+    socks = []
+    for _ in range(args.subscribers):
+        s = socket.create_connection(('127.0.0.1', port))
+        s.sendall(b'GET /events/stream HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n')
+        s.setblocking(False)
+        sel.register(s, selectors.EVENT_READ, bytearray())
+        socks.append(s)
+    deadline = time.perf_counter() + 60
+    while emitter.EVENT_HUB.stats()['streams'] < args.subscribers:
+        if time.perf_counter() > deadline:
+            print('subscribers did not connect in time', file=sys.stderr)
+            return 1
+        time.sleep(0.05)
+
+    latencies = []
+    received = [0]
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            for key, _ in sel.select(0.2):
+                try:
+                    data = key.fileobj.recv(65536)
+                except BlockingIOError:
+                    continue
+                now = time.perf_counter()
+                buf = key.data
+                buf += data
+                while b'\n\n' in buf:
+                    frame, _, rest = bytes(buf).partition(b'\n\n')
+                    buf[:] = rest
+                    for line in frame.split(b'\n'):
+                        if line.startswith(b'data: '):
+                            sent_at = json.loads(line[6:])['sentAt']
+                            with lock:
+                                latencies.append(now - sent_at)
+                                received[0] += 1
+
+    t = threading.Thread(target=reader, daemon=True)
+    t.start()
+    expected = args.subscribers * args.events
+    start = time.perf_counter()
+    for i in range(args.events):
+        emitter._upsert_event({'id': f'bench_{i}', 'channelId': 'bench', 'content': 'bench', 'sentAt': time.perf_counter()})
+        time.sleep(args.gap_ms / 1000.0)
+    deadline = time.perf_counter() + 30
+    while received[0] < expected and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    t.join()
+    for s in socks:
+        s.close()
+    srv.shutdown()
+    print(json.dumps({
+        'subscribers': args.subscribers,
+        'events': args.events,
+        'delivered': received[0],
+        'expected': expected,
+        'elapsed_s': round(elapsed, 3),
+        'fanout_ms': {
+            'p50': round(_percentile(latencies, 50) * 1000, 2),
+            'p99': round(_percentile(latencies, 99) * 1000, 2),
+            'max': round(max(latencies) * 1000, 2) if latencies else 0.0,
+        },
+        'hub': emitter.EVENT_HUB.stats(),
+    }))
+    return 0 if received[0] == expected else 1
+
+
+# --- HTTP front ends -----------------------------------------------------------
+
+HTTP_ROUTES = {
+    'health': ('GET', '/health', b''),
+    'events': ('GET', '/events', b''),
+    'event': ('POST', '/event', b'{"channelId": "bench", "content": "bench"}'),
+    'send': ('POST', '/send', b'{"content": "bench"}'),
+}
+
+
+def _http_server_proc(mode, workers, send_latency_ms, conn):
+    # Runs in a forked child so the server does not share a GIL with the load generator.
+    emitter.Handler.log_message = lambda *a: None
+    emitter.HTTP_WORKERS = workers
+    for i in range(50):
+        emitter._upsert_event({'id': f'bench_{i}', 'channelId': 'bench', 'content': f'bench {i}', 'createdAt': '2026-01-01T00:00:00Z'})
+    pipeline = emitter.DeliveryPipeline(lambda job: True, 2, 1000000)
+    pipeline.start()
+    emitter.DELIVERY_PIPELINE = pipeline
+    emitter.DEVICE_TOKENS = ['bench']
+
+    def fanout(client, content, tokens, *args, **kwargs):
+        # Stands in for a blocking APNs round trip.
+        time.sleep(send_latency_ms / 1000.0)
+        return {t: 'Success' for t in tokens}
+
+    emitter.fanout_apns = fanout
+    srv = emitter.serve_http('127.0.0.1', 0, mode)
+    conn.send(srv.server_address[1])
+    conn.recv()
+    srv.shutdown()
+
+
+async def _http_worker(port, requests, depth, latencies, counts):
+    request = requests[0]
+    reader = writer = None
+    while counts['left'] > 0:
+        n = min(depth, counts['left'])
+        counts['left'] -= n
+        if writer is None:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            counts['connects'] += 1
+        sent_at = time.perf_counter()
+        writer.write(request * n)
+        answered = 0
+        close = False
+        try:
+            while answered < n:
+                head = await reader.readuntil(b'\r\n\r\n')
+                status = int(head[9:12])
+                lower = head.lower()
+                length = 0
+                idx = lower.find(b'content-length:')
+                if idx >= 0:
+                    length = int(lower[idx + 15:lower.index(b'\r\n', idx)])
+                if length:
+                    await reader.readexactly(length)
+                latencies.append(time.perf_counter() - sent_at)
+                answered += 1
+                if status >= 500:
+                    counts['errors'] += 1
+                close = head.startswith(b'HTTP/1.0') and b'connection: keep-alive' not in lower or b'connection: close' in lower
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            counts['errors'] += 1
+            close = True
+        # Requests the server closed on are sent again on a new connection.
+        counts['left'] += n - answered
+        if close:
+            writer.close()
+            writer = None
+            if answered == 0:
+                break
+    if writer is not None:
+        writer.close()
+
+
+async def _http_load(port, args, method, path, body):
+    request = f'{method} {path} HTTP/1.1\r\nHost: bench\r\n'.encode('latin-1')
+    if body:
+        request += f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'.encode('latin-1')
+    request += b'\r\n' + body
+    latencies = []
+    counts = {'left': args.requests, 'connects': 0, 'errors': 0}
+    await asyncio.gather(*(_http_worker(port, [request], args.pipeline, latencies, counts) for _ in range(args.connections)))
+    return latencies, counts
+
+
+def run_http(args, mode):
+    ctx = multiprocessing.get_context('fork')
+    parent, child = ctx.Pipe()
+    proc = ctx.Process(target=_http_server_proc, args=(mode, args.workers, args.send_latency_ms, child), daemon=True)
+    proc.start()
+    port = parent.recv()
+    method, path, body = HTTP_ROUTES[args.route]
+    start = time.perf_counter()
+    latencies, counts = asyncio.run(_http_load(port, args, method, path, body))
+    elapsed = time.perf_counter() - start
+    parent.send('stop')
+    proc.join(5)
+    if proc.is_alive():
+        proc.terminate()
+    return {
+        'mode': mode,
+        'route': f'{method} {path}',
+        'connections': args.connections,
+        'pipeline': args.pipeline,
+        'requests': len(latencies),
+        'errors': counts['errors'],
+        'connects': counts['connects'],
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_s': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': round(_percentile(latencies, 50) * 1000, 2),
+            'p99': round(_percentile(latencies, 99) * 1000, 2),
+            'max': round(max(latencies) * 1000, 2) if latencies else 0.0,
+        },
+    }
+
+
+def bench_http(args):
+    _raise_fd_limit(args.connections * 2 + 256)
+    results = []
+    for mode in [m.strip() for m in args.modes.split(',') if m.strip()]:
+        result = run_http(args, mode)
+        print(json.dumps(result))
+        sys.stdout.flush()
+        results.append(result)
+    if len(results) > 1 and results[0]['requests_per_s']:
+        base = results[0]
+        print(json.dumps({'baseline': base['mode'], 'speedup': {
+            r['mode']: round(r['requests_per_s'] / base['requests_per_s'], 2) for r in results[1:]}}))
+    return 1 if any(r['requests'] < args.requests for r in results) else 0
+
+
+# --- End to end --------------------------------------------------------------
+
+# A sqlite stand-in for the MySQL tables the emitter reads. It speaks the small part
+# of the pymysql API the emitter uses (context-managed cursors, %s placeholders, dict
+# rows, ping/open), so it plugs into DbPool in place of connect_db.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tify_messages (
+    id TEXT PRIMARY KEY, channel_id TEXT NOT NULL, content TEXT,
+    created_at timestamp NOT NULL, event_at timestamp,
+    is_emergency INTEGER DEFAULT 0, priority TEXT DEFAULT 'MEDIUM'
+);
+CREATE INDEX IF NOT EXISTS tify_messages_created_at_id_idx ON tify_messages (created_at, id);
+CREATE TABLE IF NOT EXISTS tify_channel_subscriptions (
+    channel_id TEXT NOT NULL, user_id TEXT NOT NULL, subscribed_at timestamp,
+    is_active INTEGER DEFAULT 1, receive_messages INTEGER DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS tify_channel_subscriptions_channel_idx ON tify_channel_subscriptions (channel_id);
+CREATE TABLE IF NOT EXISTS tify_user_messaging_settings (
+    user_id TEXT NOT NULL, platform TEXT NOT NULL, handle TEXT, is_enabled INTEGER DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS tify_user_messaging_settings_user_idx ON tify_user_messaging_settings (user_id);
+CREATE TABLE IF NOT EXISTS tify_emitter_instances (
+    id TEXT PRIMARY KEY, hostname TEXT, address TEXT, started_at timestamp, heartbeat_at timestamp
+);
+CREATE TABLE IF NOT EXISTS tify_emitter_leases (
+    partition_id INTEGER PRIMARY KEY, owner TEXT, expires_at timestamp,
+    checkpoint_at timestamp, checkpoint_id TEXT, updated_at timestamp
+);
+"""
+
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(' ', timespec='microseconds'))
+sqlite3.register_converter('timestamp', lambda b: datetime.fromisoformat(b.decode('utf-8')))
+
+
+class SqliteCursor:
+    def __init__(self, cur):
+        self._cur = cur
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cur.close()
+
+    def execute(self, query, args=()):
+        self._cur.execute(query.replace('%s', '?'), tuple(args or ()))
+
+    def executemany(self, query, rows):
+        self._cur.executemany(query.replace('%s', '?'), rows)
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        return dict(row) if row is not None else None
+
+    def fetchall(self):
+        return [dict(r) for r in self._cur.fetchall()]
+
+
+class SqliteConn:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.create_function('CRC32', 1, lambda v: zlib.crc32(str(v).encode('utf-8')), deterministic=True)
+        self._conn.create_function('MOD', 2, lambda a, b: a % b, deterministic=True)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self.open = True
+
+    def cursor(self, cursor_class=None):
+        return SqliteCursor(self._conn.cursor())
+
+    def ping(self, reconnect=False):
+        self._conn.execute('SELECT 1')
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.open = False
+        self._conn.close()
+
+
+def seed_sqlite(path, channels, channel_size):
+    conn = SqliteConn(path)
+    conn._conn.executescript(SQLITE_SCHEMA)
+    since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=1)
+    subs, settings = [], []
+    for c in range(channels):
+        for u in range(channel_size):
+            user = f'user-{c}-{u}'
+            subs.append((f'channel-{c}', user, since))
+            settings.append((user, 'PUSH', f'{c:08x}{u:056x}'))
+    with conn.cursor() as cur:
+        cur.execute('BEGIN')
+        cur.executemany("INSERT INTO tify_channel_subscriptions (channel_id, user_id, subscribed_at) VALUES (%s, %s, %s)", subs)
+        cur.executemany("INSERT INTO tify_user_messaging_settings (user_id, platform, handle) VALUES (%s, %s, %s)", settings)
+        cur.execute('COMMIT')
+    return conn
+
+
+def insert_messages(conn, start, count, channels):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows = [(f'msg-{i:09d}', f'channel-{i % channels}', f'bench {i}', now, None) for i in range(start, start + count)]
+    with conn.cursor() as cur:
+        cur.execute('BEGIN')
+        cur.executemany("INSERT INTO tify_messages (id, channel_id, content, created_at, event_at) VALUES (%s, %s, %s, %s, %s)", rows)
+        cur.execute('COMMIT')
+
+
+class _BenchPayload:
+    # Stands in for apns2.Payload when apns2 is not installed.
+    def __init__(self, alert=None, sound=None, badge=None, **extra):
+        self._aps = {'alert': alert, 'sound': sound, 'badge': badge}
+        self._aps.update({k.replace('_', '-'): v for k, v in extra.items() if v is not None})
+
+    def dict(self):
+        return {'aps': self._aps}
+
+
+def _rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1048576, 1)
+    except Exception:
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def run_e2e(args, channel_size, backlog):
+    tmp = tempfile.mkdtemp(prefix='emitter-e2e-')
+    path = os.path.join(tmp, 'tify.db')
+    writer = seed_sqlite(path, args.channels, channel_size)
+    apns = fake_apns_server(args.apns_latency_ms, args.apns_error_rate)
+    hook = fake_webhook_server(args.webhook_latency_ms) if args.webhook else None
+    host, port = apns.server_address
+
+    if emitter.Payload is None:
+        emitter.Payload = _BenchPayload
+    emitter.APNS_TOPIC = 'bench.topic'
+    emitter.GLOBAL_APNS_CLIENT = emitter.ApnsFanout(lambda: FakeApnsClient(host, port), args.apns_concurrency, emitter.APNS_BATCH_SIZE)
+    emitter.WEBHOOK_SENDER = None
+    if hook is not None:
+        hook_host, hook_port = hook.server_address
+        emitter.WEBHOOK_SENDER = emitter.WebhookSender(f'http://{hook_host}:{hook_port}/hook', args.webhook_batch_size,
+                                                       0.2, emitter.WEBHOOK_RETRIES, 5, None, args.workers)
+    # --post needs the journal: it is what lets the poller recognise rows the API already posted.
+    emitter.JOURNAL = emitter.DeliveryJournal(os.path.join(tmp, 'journal.db')) if args.post else None
+    emitter.INGEST_WATERMARK = emitter.IngestWatermark()
+    emitter.RECIPIENT_CACHE.invalidate()
+    emitter.DB_POOL = emitter.DbPool(lambda: SqliteConn(path), args.db_pool, 10, emitter.DB_PING_AFTER)
+    emitter.COALESCER = None
+    if args.coalesce_ms:
+        emitter.COALESCER = emitter.ChannelCoalescer(args.coalesce_ms / 1000.0, send=emitter._send_summary)
+        emitter.COALESCER.start()
+
+    total = backlog + args.messages
+    done = {'messages': 0, 'notifications': 0, 'posted': 0}
+    seen = set()
+    latencies = []
+    lock = threading.Lock()
+    finished = threading.Event()
+
+    def on_done(job, ok):
+        emitter.on_delivery_done(job, ok)
+        row = job.get('row')
+        message_id = row['id'] if row is not None else job.get('messageId')
+        created = emitter._naive_utc(job.get('createdAt'))
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        with lock:
+            if row is None:
+                done['posted'] += 1
+            # With --post a message is done by whichever of its two jobs pushed it.
+            if job.get('duplicate') or message_id in seen:
+                return
+            seen.add(message_id)
+            done['messages'] += 1
+            done['notifications'] += len(job.get('tokens') or ())
+            if message_id >= f'msg-{backlog:09d}':
+                latencies.append((now - created).total_seconds())
+            if done['messages'] >= total:
+                finished.set()
+
+    pipeline = emitter.DeliveryPipeline(emitter.deliver_message, args.workers, emitter.DELIVERY_QUEUE_SIZE, on_done)
+    pipeline.start()
+    emitter.DELIVERY_PIPELINE = pipeline
+    scheduler = emitter.PollScheduler(args.poll_min_ms / 1000.0, 1.0, 2)
+    stop = threading.Event()
+    checkpoint = (datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=1), None)
+    insert_messages(writer, 0, backlog, args.channels)
+    rss_before = _rss_mb()
+
+    start = time.perf_counter()
+    poller = threading.Thread(target=emitter.run_poller, args=(pipeline, checkpoint, scheduler, stop), daemon=True)
+    poller.start()
+    # Live traffic: small inserts at the requested rate, each followed by a wake-up
+    # as the API would send it.
+    gap = 1.0 / args.rate if args.rate else 0.0
+    for i in range(backlog, total, args.insert_batch):
+        insert_messages(writer, i, min(args.insert_batch, total - i), args.channels)
+        if args.post:
+            # As messages.js does for emergencies: POST /event with the row's id right after the insert.
+            for n in range(i, min(i + args.insert_batch, total)):
+                emitter.accept_event({'id': f'msg-{n:09d}', 'channelId': f'channel-{n % args.channels}', 'content': f'bench {n}'})
+        if args.wake:
+            scheduler.wake()
+        if gap:
+            time.sleep(gap * args.insert_batch)
+    finished.wait(args.timeout)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    scheduler.wake()
+    poller.join(5)
+    pipeline.stop()
+    coalescing = None
+    if emitter.COALESCER is not None:
+        emitter.COALESCER.close()
+        coalescing = emitter.COALESCER.stats()
+    emitter.GLOBAL_APNS_CLIENT._executor.shutdown(wait=False)
+    if emitter.WEBHOOK_SENDER is not None:
+        emitter.WEBHOOK_SENDER.close()
+    emitter.DB_POOL.close()
+    if emitter.JOURNAL is not None:
+        emitter.JOURNAL.close()
+        emitter.JOURNAL = None
+    writer.close()
+    apns.shutdown()
+    if hook is not None:
+        hook.shutdown()
+    for f in os.listdir(tmp):
+        os.remove(os.path.join(tmp, f))
+    os.rmdir(tmp)
+    return {
+        'channel_size': channel_size,
+        'backlog': backlog,
+        'messages': done['messages'],
+        'expected': total,
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_s': round(done['messages'] / elapsed, 1) if elapsed else 0.0,
+        'notifications_per_s': round(done['notifications'] / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': round(_percentile(latencies, 50) * 1000, 2),
+            'p99': round(_percentile(latencies, 99) * 1000, 2),
+            'max': round(max(latencies) * 1000, 2) if latencies else 0.0,
+        },
+        'apns_received': dict(apns.received),
+        'apns_expected': total * channel_size,
+        'posted': done['posted'],
+        'webhook_received': dict(hook.received) if hook is not None else None,
+        'coalescing': coalescing,
+        'rss_mb': {'before': rss_before, 'after': _rss_mb()},
+        'polls': scheduler.polls,
+    }
+
+
+def bench_e2e(args):
+    emitter.Handler.log_message = lambda *a: None
+    failed = False
+    for size in [int(x) for x in args.channel_sizes.split(',') if x.strip()]:
+        for backlog in [int(x) for x in args.backlogs.split(',') if x.strip()]:
+            result = run_e2e(args, size, backlog)
+            print(json.dumps(result))
+            sys.stdout.flush()
+            failed = failed or result['messages'] < result['expected']
+            # Each message reaches each subscriber once, however many times it was posted.
+            failed = failed or (not args.apns_error_rate and result['apns_received']['notifications'] > result['apns_expected'])
+    return 1 if failed else 0
+
+
+def _cluster_proc(index, path, args, apns_address, checkpoint, delivered, stop):
+    # One emitter instance per forked child: the module globals are per process.
+    if emitter.Payload is None:
+        emitter.Payload = _BenchPayload
+    emitter.APNS_TOPIC = 'bench.topic'
+    emitter.GLOBAL_APNS_CLIENT = emitter.ApnsFanout(lambda: FakeApnsClient(*apns_address), args.apns_concurrency, emitter.APNS_BATCH_SIZE)
+    emitter.WEBHOOK_SENDER = None
+    emitter.JOURNAL = None
+    emitter.COALESCER = None
+    emitter.RECIPIENT_CACHE.invalidate()
+    emitter.DB_POOL = emitter.DbPool(lambda: SqliteConn(path), args.db_pool, 10, emitter.DB_PING_AFTER)
+    scheduler = emitter.PollScheduler(args.poll_min_ms / 1000.0, 0.25, 2)
+    emitter.POLL_SCHEDULER = scheduler
+    cluster = emitter.ClusterCoordinator(emitter.DB_POOL, args.partitions, f'bench-{index}', args.lease_seconds, checkpoint)
+    emitter.CLUSTER = cluster
+
+    def on_done(job, ok):
+        emitter.on_delivery_done(job, ok)
+        row = job.get('row')
+        if row is not None and ok and not job.get('duplicate'):
+            delivered.put((index, row['id'], len(job.get('tokens') or ()), time.time()))
+
+    pipeline = emitter.DeliveryPipeline(emitter.deliver_message, args.workers, emitter.DELIVERY_QUEUE_SIZE, on_done)
+    pipeline.start()
+    emitter.DELIVERY_PIPELINE = pipeline
+    cluster.start()
+    poller_stop = threading.Event()
+    poller = threading.Thread(target=emitter.run_poller, args=(pipeline, checkpoint, scheduler, poller_stop, cluster), daemon=True)
+    poller.start()
+    stop.wait()
+    poller_stop.set()
+    scheduler.wake()
+    poller.join(5)
+    pipeline.stop()
+    cluster.stop()
+    emitter.GLOBAL_APNS_CLIENT._executor.shutdown(wait=False)
+    emitter.DB_POOL.close()
+    delivered.put((index, None, cluster.stats(), 0.0))
+
+
+def _leases_balanced(conn, partitions, instances):
+    with conn.cursor() as cur:
+        cur.execute("SELECT owner, COUNT(*) AS n FROM tify_emitter_leases WHERE owner IS NOT NULL GROUP BY owner")
+        held = {r['owner']: r['n'] for r in cur.fetchall()}
+    return (sum(held.values()) == partitions and len(held) == min(instances, partitions)
+            and max(held.values()) <= -(-partitions // instances))
+
+
+def run_cluster(args, instances):
+    tmp = tempfile.mkdtemp(prefix='emitter-cluster-')
+    path = os.path.join(tmp, 'tify.db')
+    writer = seed_sqlite(path, args.channels, args.channel_size)
+    apns = fake_apns_server(args.apns_latency_ms)
+    checkpoint = (datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=1), None)
+    # The backlog is delivered while the instances are still claiming and handing
+    # partitions back, which is where a release racing a scan would push twice.
+    insert_messages(writer, 0, args.backlog, args.channels)
+    ctx = multiprocessing.get_context('fork')
+    delivered = ctx.Queue()
+    stop = ctx.Event()
+    procs = [ctx.Process(target=_cluster_proc, args=(i, path, args, apns.server_address, checkpoint, delivered, stop), daemon=True)
+             for i in range(instances)]
+    for proc in procs:
+        proc.start()
+
+    total = args.backlog + args.messages
+    seen = set()
+    state = {'deliveries': 0, 'notifications': 0, 'last': 0.0}
+    per_instance = [0] * instances
+
+    def drain(timeout=0.2):
+        try:
+            index, message_id, tokens, at = delivered.get(timeout=timeout)
+        except Exception:
+            return
+        state['deliveries'] += 1
+        state['notifications'] += tokens
+        state['last'] = max(state['last'], at)
+        per_instance[index] += 1
+        seen.add(message_id)
+
+    deadline = time.monotonic() + args.timeout
+    balanced = False
+    while time.monotonic() < deadline:
+        drain()
+        balanced = _leases_balanced(writer, args.partitions, instances)
+        if balanced and len(seen) >= args.backlog:
+            break
+    live_start = time.time()
+    for i in range(args.backlog, total, args.insert_batch):
+        insert_messages(writer, i, min(args.insert_batch, total - i), args.channels)
+    while len(seen) < total and time.monotonic() < deadline:
+        drain()
+    elapsed = max(0.0, state['last'] - live_start)
+    stop.set()
+    stats = []
+    end = time.monotonic() + 10
+    while len(stats) < instances and time.monotonic() < end:
+        try:
+            index, message_id, tokens, at = delivered.get(timeout=0.5)
+        except Exception:
+            continue
+        if message_id is None:
+            stats.append(tokens)
+            continue
+        # Late pushes still count towards duplicates.
+        state['deliveries'] += 1
+        state['notifications'] += tokens
+        per_instance[index] += 1
+        seen.add(message_id)
+    for proc in procs:
+        proc.join(5)
+        if proc.is_alive():
+            proc.terminate()
+    writer.close()
+    apns.shutdown()
+    for f in os.listdir(tmp):
+        os.remove(os.path.join(tmp, f))
+    os.rmdir(tmp)
+    return {
+        'instances': instances,
+        'partitions': args.partitions,
+        'balanced': balanced,
+        'messages': len(seen),
+        'expected': total,
+        'duplicates': state['deliveries'] - len(seen),
+        'per_instance': per_instance,
+        'live_elapsed_s': round(elapsed, 3),
+        'live_messages_per_s': round(args.messages / elapsed, 1) if elapsed and len(seen) >= total else 0.0,
+        'apns_received': dict(apns.received),
+        'apns_expected': total * args.channel_size,
+        'releases': sum(st['releases'] for st in stats),
+        'claims': sum(st['claims'] for st in stats),
+    }
+
+
+def bench_cluster(args):
+    failed = False
+    baseline = None
+    for n in [int(x) for x in args.instances.split(',') if x.strip()]:
+        result = run_cluster(args, n)
+        rate = result['live_messages_per_s']
+        if baseline is None:
+            baseline = rate
+        result['speedup'] = round(rate / baseline, 2) if baseline else 0.0
+        print(json.dumps(result))
+        sys.stdout.flush()
+        failed = failed or result['messages'] < result['expected'] or result['duplicates'] > 0
+        # Each message reaches each subscriber once, whichever instance pushed it.
+        failed = failed or result['apns_received']['notifications'] != result['apns_expected']
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='event_emitter benchmarks')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    p = sub.add_parser('apns', help='APNs fan-out throughput against a local fake APNs server')
+    p.add_argument('--tokens', type=int, default=20000)
+    p.add_argument('--concurrency', type=int, default=emitter.APNS_CONCURRENCY)
+    p.add_argument('--batch-size', type=int, default=emitter.APNS_BATCH_SIZE)
+    p.add_argument('--latency-ms', type=float, default=2.0)
+    p.add_argument('--error-rate', type=float, default=0.0)
+    p.add_argument('--target', type=float, default=0.0, help='minimum notifications/s, exit 1 if missed')
+    p.set_defaults(func=bench_apns)
+
+    p = sub.add_parser('webhook', help='webhook throughput and POST latency against a local receiver')
+    p.add_argument('--events', type=int, default=5000)
+    p.add_argument('--concurrency', type=int, default=emitter.DELIVERY_WORKERS)
+    p.add_argument('--batch-size', type=int, default=0, help='0 posts every event on its own')
+    p.add_argument('--flush-ms', type=float, default=200.0)
+    p.add_argument('--retries', type=int, default=emitter.WEBHOOK_RETRIES)
+    p.add_argument('--latency-ms', type=float, default=1.0)
+    p.add_argument('--error-rate', type=float, default=0.0)
+    p.set_defaults(func=bench_webhook)
+
+    p = sub.add_parser('journal', help='journal write overhead per message and restart recovery time')
+    p.add_argument('--messages', type=int, default=100000)
+    p.add_argument('--replay', type=int, default=1000, help='messages re-read after the restart')
+    p.set_defaults(func=bench_journal)
+
+    p = sub.add_parser('sse', help='fan-out latency from _upsert_event to N local SSE subscribers')
+    p.add_argument('--subscribers', type=int, default=1000)
+    p.add_argument('--events', type=int, default=20)
+    p.add_argument('--gap-ms', type=float, default=50.0)
+    p.set_defaults(func=bench_sse)
+
+    p = sub.add_parser('e2e', help='poller to APNs/webhook throughput and latency on a seeded sqlite database')
+    p.add_argument('--channels', type=int, default=10)
+    p.add_argument('--channel-sizes', default='10,100,1000', help='comma separated subscribers per channel')
+    p.add_argument('--backlogs', default='0,1000', help='comma separated rows already waiting at start')
+    p.add_argument('--messages', type=int, default=500, help='live rows inserted while running')
+    p.add_argument('--rate', type=float, default=200.0, help='live rows per second, 0 inserts as fast as possible')
+    p.add_argument('--insert-batch', type=int, default=1)
+    p.add_argument('--wake', action='store_true', help='wake the poller after each insert like POST /poll/wake')
+    p.add_argument('--poll-min-ms', type=float, default=50.0)
+    p.add_argument('--workers', type=int, default=emitter.DELIVERY_WORKERS)
+    p.add_argument('--db-pool', type=int, default=emitter.DB_POOL_SIZE)
+    p.add_argument('--apns-concurrency', type=int, default=emitter.APNS_CONCURRENCY)
+    p.add_argument('--apns-latency-ms', type=float, default=1.0)
+    p.add_argument('--apns-error-rate', type=float, default=0.0)
+    p.add_argument('--coalesce-ms', type=float, default=0.0, help='per-channel coalescing window, 0 disables it')
+    p.add_argument('--post', action='store_true', help='also POST /event every row like the API does, with the journal on')
+    p.add_argument('--webhook', action='store_true', help='also post every row to a local webhook receiver')
+    p.add_argument('--webhook-batch-size', type=int, default=0)
+    p.add_argument('--webhook-latency-ms', type=float, default=1.0)
+    p.add_argument('--timeout', type=float, default=120.0)
+    p.set_defaults(func=bench_e2e)
+
+    p = sub.add_parser('http', help='requests/s and latency of the threading and asyncio HTTP front ends')
+    p.add_argument('--modes', default='threading,asyncio', help='comma separated EMITTER_HTTP_MODE values, the first is the baseline')
+    p.add_argument('--route', choices=sorted(HTTP_ROUTES), default='events')
+    p.add_argument('--connections', type=int, default=64)
+    p.add_argument('--requests', type=int, default=20000, help='requests per mode')
+    p.add_argument('--pipeline', type=int, default=1, help='requests written back to back per connection')
+    p.add_argument('--workers', type=int, default=emitter.HTTP_WORKERS, help='asyncio executor threads')
+    p.add_argument('--send-latency-ms', type=float, default=5.0, help='simulated APNs round trip for --route send')
+    p.set_defaults(func=bench_http)
+
+    p = sub.add_parser('cluster', help='N instances sharing one sqlite database: duplicate pushes and throughput scaling')
+    p.add_argument('--instances', default='1,2,4', help='comma separated instance counts, the first is the baseline')
+    p.add_argument('--partitions', type=int, default=16)
+    p.add_argument('--lease-seconds', type=int, default=3)
+    p.add_argument('--channels', type=int, default=64)
+    p.add_argument('--channel-size', type=int, default=5)
+    p.add_argument('--backlog', type=int, default=500, help='rows waiting while the instances claim partitions')
+    p.add_argument('--messages', type=int, default=2000, help='rows inserted once the leases are balanced')
+    p.add_argument('--insert-batch', type=int, default=100)
+    p.add_argument('--poll-min-ms', type=float, default=50.0)
+    p.add_argument('--workers', type=int, default=4, help='delivery workers per instance')
+    p.add_argument('--db-pool', type=int, default=emitter.DB_POOL_SIZE)
+    p.add_argument('--apns-concurrency', type=int, default=2)
+    p.add_argument('--apns-latency-ms', type=float, default=2.0)
+    p.add_argument('--timeout', type=float, default=120.0)
+    p.set_defaults(func=bench_cluster)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
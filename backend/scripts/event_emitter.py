@@ -1,11 +1,28 @@
 import os
 import time
+import asyncio
+import io
 import socket
+import sqlite3
+import gzip
 import json
+import queue
+import random
+import selectors
+import signal
 import threading
+import uuid
+import zlib
+from bisect import bisect_left
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.client import HTTPConnection, parse_headers
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email.utils import formatdate
 from datetime import datetime, timedelta, timezone
-from urllib.parse import urlparse
+from urllib.parse import urlparse, parse_qs
 
 try:
     import pymysql
@@ -26,6 +43,13 @@ except Exception:
     Payload = None
     TokenCredentials = None
 
+try:
+    from apns2.client import Notification
+    from apns2.errors import APNsException
+except Exception:
+    Notification = None
+    APNsException = None
+
 def _env(k, d=None):
     v = os.environ.get(k)
     return v if v is not None and v != '' else d
@@ -36,8 +60,35 @@ DB_PASSWORD = _env('DB_PASSWORD', 'Pop654--.123SD')
 DB_NAME = _env('DB_NAME', 'u803886834_dev_tify')
 DB_PORT = int(_env('DB_PORT', '3306'))
 POLL_INTERVAL = int(_env('EMITTER_POLL_INTERVAL', '15'))
+POLL_MIN_INTERVAL = float(_env('EMITTER_POLL_MIN_INTERVAL', '0.5'))
+# None follows POLL_INTERVAL, resolved when the scheduler is built so backend/.env applies.
+POLL_MAX_INTERVAL = float(_env('EMITTER_POLL_MAX_INTERVAL')) if _env('EMITTER_POLL_MAX_INTERVAL') else None
+POLL_BACKOFF = float(_env('EMITTER_POLL_BACKOFF', '2'))
 LOOKBACK_SECONDS = int(_env('EMITTER_LOOKBACK_SECONDS', '300'))
+FETCH_PAGE_SIZE = int(_env('EMITTER_FETCH_PAGE_SIZE', '200'))
+DB_POOL_SIZE = int(_env('EMITTER_DB_POOL_SIZE', '4'))
+DB_POOL_TIMEOUT = float(_env('EMITTER_DB_POOL_TIMEOUT', '10'))
+DB_PING_AFTER = 30
+DB_MAX_BACKOFF = 30
 WEBHOOK_URL = _env('EMITTER_WEBHOOK_URL')
+WEBHOOK_BATCH_SIZE = int(_env('EMITTER_WEBHOOK_BATCH_SIZE', '0'))
+WEBHOOK_FLUSH_SECONDS = float(_env('EMITTER_WEBHOOK_FLUSH_SECONDS', '1'))
+WEBHOOK_RETRIES = int(_env('EMITTER_WEBHOOK_RETRIES', '4'))
+WEBHOOK_TIMEOUT = 5
+WEBHOOK_MAX_BACKOFF = 30
+WEBHOOK_MAX_PENDING = int(_env('EMITTER_WEBHOOK_MAX_PENDING', '10000'))
+WEBHOOK_CLOSE_SECONDS = 10
+DATA_DIR = _env('EMITTER_DATA_DIR', os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.emitter')))
+WEBHOOK_SPOOL_PATH = _env('EMITTER_WEBHOOK_SPOOL')
+JOURNAL_PATH = _env('EMITTER_JOURNAL_PATH')
+JOURNAL_RETENTION_SECONDS = int(_env('EMITTER_JOURNAL_RETENTION_SECONDS', '86400'))
+JOURNAL_COMPACT_SECONDS = 600
+CLUSTER_PARTITIONS = int(_env('EMITTER_CLUSTER_PARTITIONS', '0'))
+CLUSTER_INSTANCE_ID = _env('EMITTER_INSTANCE_ID')
+CLUSTER_LEASE_SECONDS = int(_env('EMITTER_CLUSTER_LEASE_SECONDS', '30'))
+# host:port the other instances use to reach this one's HTTP server (defaults to the
+# bind host, or the hostname when binding every interface, and EMITTER_HTTP_PORT).
+CLUSTER_ADDRESS = _env('EMITTER_CLUSTER_ADDRESS')
 
 APNS_AUTH_KEY_PATH = _env('APNS_AUTH_KEY_PATH')
 APNS_KEY_ID = _env('APNS_KEY_ID')
@@ -45,9 +96,32 @@ APNS_TEAM_ID = _env('APNS_TEAM_ID')
 APNS_TOPIC = _env('APNS_TOPIC')
 APNS_USE_SANDBOX = _env('APNS_ENV', 'sandbox') == 'sandbox'
 DEVICE_TOKENS = [t.strip() for t in (_env('APNS_DEVICE_TOKENS', '') or '').split(',') if t.strip()]
+APNS_CONCURRENCY = int(_env('EMITTER_APNS_CONCURRENCY', '8'))
+APNS_BATCH_SIZE = int(_env('EMITTER_APNS_BATCH_SIZE', '500'))
+APNS_PRUNE_BATCH = 500
+APNS_DEAD_TTL = float(_env('EMITTER_APNS_DEAD_TTL', '3600'))
+COALESCE_SECONDS = float(_env('EMITTER_COALESCE_SECONDS', '0'))
+COALESCE_CHANNELS = _env('EMITTER_COALESCE_CHANNELS', '')
+RECIPIENT_CACHE_TTL = int(_env('EMITTER_RECIPIENT_CACHE_TTL', '60'))
+RECIPIENT_CACHE_CHANNELS = int(_env('EMITTER_RECIPIENT_CACHE_CHANNELS', '1000'))
+RECIPIENT_CACHE_HANDLES = int(_env('EMITTER_RECIPIENT_CACHE_HANDLES', '500000'))
+DELIVERY_WORKERS = int(_env('EMITTER_DELIVERY_WORKERS', '4'))
+DELIVERY_QUEUE_SIZE = int(_env('EMITTER_DELIVERY_QUEUE_SIZE', '1000'))
+TRACKING_CAPACITY = int(_env('EMITTER_TRACKING_CAPACITY', '10000'))
+BATCH_MAX_EVENTS = int(_env('EMITTER_BATCH_MAX_EVENTS', '1000'))
+MAX_BODY_BYTES = 5 * 1024 * 1024
+ENQUEUE_TIMEOUT = 0.5
 HTTP_PORT = int(_env('EMITTER_HTTP_PORT', '8766'))
 BIND_HOST = _env('EMITTER_BIND_HOST', '0.0.0.0')
-RECENT_EVENTS = []
+HTTP_MODE = _env('EMITTER_HTTP_MODE', 'threading')
+HTTP_WORKERS = int(_env('EMITTER_HTTP_WORKERS', '16'))
+HTTP_KEEPALIVE_SECONDS = float(_env('EMITTER_HTTP_KEEPALIVE_SECONDS', '15'))
+RECENT_EVENTS_CAPACITY = int(_env('EMITTER_RECENT_EVENTS_CAPACITY', '200'))
+GZIP_MIN_BYTES = 1024
+STREAM_MAX_SUBSCRIBERS = int(_env('EMITTER_STREAM_MAX_SUBSCRIBERS', '10000'))
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_MAX_BUFFER = 1 << 20
+LONG_POLL_TIMEOUT = 25
 
 def _format_event_date(iso):
     try:
@@ -58,25 +132,487 @@ def _format_event_date(iso):
     months = ['ene','feb','mar','abr','may','jun','jul','ago','sep','oct','nov','dic']
     return f"{days[dt.weekday()]} {dt.day} {months[dt.month-1]}"
 
-def _upsert_event(evt):
-    try:
-        idx = next((i for i,e in enumerate(RECENT_EVENTS) if e.get('id') == evt.get('id')), None)
-    except Exception:
-        idx = None
-    if idx is None:
-        RECENT_EVENTS.append(evt)
-    else:
-        prev = RECENT_EVENTS[idx]
-        new_has = bool(evt.get('eventAt'))
-        prev_has = bool(prev.get('eventAt'))
-        if new_has and not prev_has:
-            RECENT_EVENTS[idx] = evt
-        elif (not new_has and prev_has):
+# Prometheus text exposition for GET /metrics. Counters and histograms are updated
+# under a per-metric lock (a dict update or bisect); gauges are read at scrape time.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+COUNT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+def _metric_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for n, v in zip(names, values):
+        v = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{n}="{v}"')
+    return '{' + ','.join(pairs) + '}'
+
+class _Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_metric_labels(self.labelnames, k)} {v}" for k, v in items]
+
+class _Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + ('+Inf',), counts):
+                cumulative += c
+                lines.append(f"{self.name}_bucket{_metric_labels(self.labelnames + ('le',), key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_metric_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_metric_labels(self.labelnames, key)} {count}")
+        return lines
+
+class _Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, fn, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        if isinstance(value, dict):
+            return [f"{self.name}{_metric_labels(self.labelnames, k if isinstance(k, tuple) else (k,))} {v}" for k, v in value.items()]
+        return [f"{self.name} {value}"]
+
+# A running total kept elsewhere (a stats counter), read at scrape time like a gauge.
+class _CounterFunc(_Gauge):
+    kind = 'counter'
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = _Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS, labelnames=()):
+        metric = _Histogram(name, help_text, buckets, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text, fn, labelnames=()):
+        metric = _Gauge(name, help_text, fn, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def counter_func(self, name, help_text, fn, labelnames=()):
+        metric = _CounterFunc(name, help_text, fn, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for m in self._metrics:
+            samples = m.samples()
+            if not samples:
+                continue
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(samples)
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+METRICS = MetricsRegistry()
+M_ERRORS = METRICS.counter('emitter_errors_total', 'Exceptions caught and swallowed, by stage.', ('stage',))
+M_POLL_CYCLE = METRICS.histogram('emitter_poll_cycle_seconds', 'Time spent reading and queueing one poll cycle.')
+M_POLL_ROWS = METRICS.histogram('emitter_poll_rows', 'Message rows read per poll cycle.', COUNT_BUCKETS)
+M_INGEST_LAG = METRICS.histogram('emitter_ingest_lag_seconds', 'Delay between a row created_at and the poller reading it.')
+M_RECIPIENT_QUERY = METRICS.histogram('emitter_recipient_query_seconds', 'Latency of recipient queries.')
+M_DELIVERY_LATENCY = METRICS.histogram('emitter_delivery_latency_seconds', 'Delay between created_at and delivery completing.')
+M_APNS_SEND = METRICS.histogram('emitter_apns_send_seconds', 'Latency of one APNs fan-out (all tokens of a message).')
+M_APNS_RESULTS = METRICS.counter('emitter_apns_notifications_total', 'APNs notifications by result reason.', ('reason',))
+M_APNS_WASTED = METRICS.counter('emitter_apns_wasted_total', 'Sends avoided (duplicate, dead) or wasted on invalid tokens.', ('kind',))
+M_COALESCED = METRICS.counter('emitter_coalesced_messages_total', 'Messages merged into a channel summary push.')
+M_COALESCE_SAVED = METRICS.counter('emitter_coalesce_saved_notifications_total', 'APNs notifications not sent thanks to coalescing.')
+M_WEBHOOK_SEND = METRICS.histogram('emitter_webhook_send_seconds', 'Latency of one webhook POST including retries.')
+M_WEBHOOK_RESULTS = METRICS.counter('emitter_webhook_events_total', 'Webhook events by result.', ('result',))
+
+# Recent events indexed by id in insertion order; the oldest entry is evicted once
+# capacity is exceeded. Updates keep their original position. Every change gets a
+# sequence number so readers can ask for what changed after a cursor.
+class EventStore:
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self._events = OrderedDict()
+        self._changes = OrderedDict()
+        self._lock = threading.Lock()
+        self._render_lock = threading.Lock()
+        self._rendered = None
+        # Random, not the start time: two processes started in the same second must not
+        # accept each other's cursors.
+        self.boot = uuid.uuid4().hex[:8]
+        self.version = 0
+
+    def upsert(self, evt):
+        key = evt.get('id')
+        with self._lock:
+            prev = self._events.get(key)
+            # Never replace a version that has eventAt with one that does not.
+            if prev is not None and not evt.get('eventAt') and prev.get('eventAt'):
+                return False
+            self.version += 1
+            self._events[key] = evt
+            self._changes[key] = self.version
+            self._changes.move_to_end(key)
+            while len(self._events) > max(1, self.capacity):
+                old_key, _ = self._events.popitem(last=False)
+                self._changes.pop(old_key, None)
+            return self.version
+
+    def get(self, key):
+        with self._lock:
+            return self._events.get(key)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._events.values())
+
+    def cursor(self, version=None):
+        return f"{self.boot}-{self.version if version is None else version}"
+
+    def parse_cursor(self, cursor):
+        # Sequence number behind a cursor, or None when it is malformed or belongs to a
+        # previous process (the client then needs a full read).
+        try:
+            boot, seq = str(cursor).rsplit('-', 1)
+            seq = int(seq)
+        except Exception:
+            return None
+        if boot != self.boot or seq > self.version:
+            return None
+        return seq
+
+    def changes_since(self, seq):
+        # [(seq, event)] changed after seq, oldest first; seq None means everything.
+        with self._lock:
+            changed = []
+            for key in reversed(self._changes):
+                version = self._changes[key]
+                if seq is not None and version <= seq:
+                    break
+                changed.append((version, self._events[key]))
+            changed.reverse()
+            return changed, self.version
+
+    def since(self, cursor):
+        # Returns (events changed after cursor, new cursor), or (None, cursor) for an
+        # unknown cursor.
+        seq = self.parse_cursor(cursor)
+        if seq is None:
+            return None, self.cursor()
+        changed, version = self.changes_since(seq)
+        return [evt for _, evt in changed], self.cursor(version)
+
+    def render(self):
+        # Serialized full list, rebuilt only when the store has changed.
+        rendered = self._rendered
+        if rendered is not None and rendered[0] == self.version:
+            return rendered
+        with self._render_lock:
+            with self._lock:
+                version = self.version
+                events = list(self._events.values())
+            rendered = self._rendered
+            if rendered is None or rendered[0] != version:
+                body = json.dumps(events).encode('utf-8')
+                packed = gzip.compress(body, 6) if len(body) >= GZIP_MIN_BYTES else None
+                rendered = (version, body, packed, f'"{self.cursor(version)}"')
+                self._rendered = rendered
+            return rendered
+
+    def __len__(self):
+        return len(self._events)
+
+RECENT_EVENTS = EventStore(RECENT_EVENTS_CAPACITY)
+
+class _StreamSubscriber:
+    __slots__ = ('sock', 'kind', 'seen', 'buf', 'deadline', 'closing')
+
+    def __init__(self, sock, kind, deadline=None):
+        self.sock = sock
+        self.kind = kind
+        self.seen = 0
+        self.buf = bytearray()
+        self.deadline = deadline
+        self.closing = False
+
+# Pushes store changes to SSE and long-poll clients. HTTP handler threads write the
+# response headers and hand the socket over; one selector thread then owns every
+# idle connection, so subscribers cost a buffer each rather than a thread.
+class EventStreamHub:
+    def __init__(self, store, max_subscribers=10000):
+        self.store = store
+        self.max_subscribers = max_subscribers
+        self._sel = selectors.DefaultSelector()
+        self._inbox = deque()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._subs = {}
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._last_heartbeat = time.monotonic()
+        self.published = 0
+        self.dropped = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._sel.register(self._wake_r, selectors.EVENT_READ, None)
+                self._thread = threading.Thread(target=self._run, name='event-stream', daemon=True)
+                self._thread.start()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def full(self):
+        return len(self._subs) + len(self._inbox) >= self.max_subscribers
+
+    def publish(self, seq, evt):
+        if self._thread is None:
+            return
+        self._inbox.append(('pub', seq, evt))
+        self._wake()
+
+    def subscribe_stream(self, sock, last_event_id=None):
+        self._inbox.append(('sse', sock, last_event_id))
+        self._wake()
+
+    def subscribe_poll(self, sock, since=None, timeout=LONG_POLL_TIMEOUT):
+        self._inbox.append(('poll', sock, since, timeout))
+        self._wake()
+
+    def stats(self):
+        kinds = [sub.kind for sub in list(self._subs.values())]
+        return {
+            'streams': kinds.count('sse'),
+            'longPolls': kinds.count('poll'),
+            'published': self.published,
+            'dropped': self.dropped
+        }
+
+    def _frame(self, seq, evt):
+        return f"id: {self.store.cursor(seq)}\ndata: {json.dumps(evt)}\n\n".encode('utf-8')
+
+    def _poll_response(self, events, seq):
+        body = json.dumps(events).encode('utf-8')
+        head = (
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Type: application/json\r\n"
+            "Cache-Control: no-cache\r\n"
+            f"X-Events-Cursor: {self.store.cursor(seq)}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        return head.encode('latin-1') + body
+
+    def _add(self, sub):
+        try:
+            sub.sock.setblocking(False)
+            self._sel.register(sub.sock, selectors.EVENT_READ, sub)
+        except Exception:
+            self._close(sub)
+            return False
+        self._subs[sub.sock] = sub
+        return True
+
+    def _close(self, sub):
+        self._subs.pop(sub.sock, None)
+        try:
+            self._sel.unregister(sub.sock)
+        except Exception:
             pass
+        try:
+            sub.sock.close()
+        except Exception:
+            pass
+
+    def _send(self, sub, data, close_after=False):
+        sub.buf += data
+        sub.closing = sub.closing or close_after
+        if len(sub.buf) > STREAM_MAX_BUFFER:
+            self.dropped += 1
+            self._close(sub)
+            return
+        self._flush(sub)
+
+    def _flush(self, sub):
+        try:
+            while sub.buf:
+                n = sub.sock.send(sub.buf)
+                del sub.buf[:n]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            self._close(sub)
+            return
+        if not sub.buf and sub.closing:
+            self._close(sub)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if sub.buf else 0)
+        try:
+            self._sel.modify(sub.sock, events, sub)
+        except Exception:
+            self._close(sub)
+
+    def _handle_inbox(self):
+        pending = []
+        while self._inbox:
+            item = self._inbox.popleft()
+            if item[0] == 'pub':
+                pending.append((item[1], item[2]))
+                continue
+            if pending:
+                self._fan_out(pending)
+                pending = []
+            if item[0] == 'sse':
+                self._open_stream(item[1], item[2])
+            else:
+                self._open_poll(item[1], item[2], item[3])
+        if pending:
+            self._fan_out(pending)
+
+    def _open_stream(self, sock, last_event_id):
+        sub = _StreamSubscriber(sock, 'sse')
+        if not self._add(sub):
+            return
+        backlog = []
+        if last_event_id:
+            changed, version = self.store.changes_since(self.store.parse_cursor(last_event_id))
+            backlog = changed
+        else:
+            version = self.store.version
+        sub.seen = version
+        self._send(sub, b'retry: 3000\n\n' + b''.join(self._frame(seq, evt) for seq, evt in backlog))
+
+    def _open_poll(self, sock, since, timeout):
+        sub = _StreamSubscriber(sock, 'poll', time.monotonic() + timeout)
+        if not self._add(sub):
+            return
+        seq = self.store.parse_cursor(since) if since else None
+        if since and seq is None:
+            # Unknown cursor: answer with the full list right away.
+            changed, version = self.store.changes_since(None)
+        elif seq is None:
+            changed, version = [], self.store.version
         else:
-            RECENT_EVENTS[idx] = evt
-    if len(RECENT_EVENTS) > 200:
-        RECENT_EVENTS[:] = RECENT_EVENTS[-200:]
+            changed, version = self.store.changes_since(seq)
+        sub.seen = version
+        if changed:
+            self._send(sub, self._poll_response([evt for _, evt in changed], version), close_after=True)
+
+    def _fan_out(self, published):
+        self.published += len(published)
+        frames = [(seq, evt, self._frame(seq, evt)) for seq, evt in published]
+        for sub in list(self._subs.values()):
+            if sub.closing:
+                continue
+            fresh = [f for f in frames if f[0] > sub.seen]
+            if not fresh:
+                continue
+            sub.seen = fresh[-1][0]
+            if sub.kind == 'sse':
+                self._send(sub, b''.join(f[2] for f in fresh))
+            else:
+                self._send(sub, self._poll_response([f[1] for f in fresh], sub.seen), close_after=True)
+
+    def _tick(self, now):
+        for sub in list(self._subs.values()):
+            if sub.kind == 'poll' and not sub.closing and sub.deadline <= now:
+                self._send(sub, self._poll_response([], sub.seen), close_after=True)
+        if now - self._last_heartbeat >= STREAM_HEARTBEAT_SECONDS:
+            self._last_heartbeat = now
+            for sub in list(self._subs.values()):
+                if sub.kind == 'sse' and not sub.closing:
+                    self._send(sub, b': ping\n\n')
+
+    def _run(self):
+        while True:
+            try:
+                for key, mask in self._sel.select(1.0):
+                    if key.fileobj is self._wake_r:
+                        try:
+                            while self._wake_r.recv(4096):
+                                pass
+                        except (BlockingIOError, InterruptedError):
+                            pass
+                        continue
+                    sub = key.data
+                    if mask & selectors.EVENT_READ:
+                        try:
+                            if not sub.sock.recv(4096):
+                                self._close(sub)
+                                continue
+                        except (BlockingIOError, InterruptedError):
+                            pass
+                        except OSError:
+                            self._close(sub)
+                            continue
+                    if mask & selectors.EVENT_WRITE:
+                        self._flush(sub)
+                self._handle_inbox()
+                self._tick(time.monotonic())
+            except Exception:
+                time.sleep(0.1)
+
+EVENT_HUB = EventStreamHub(RECENT_EVENTS, STREAM_MAX_SUBSCRIBERS)
+
+def _upsert_event(evt):
+    seq = RECENT_EVENTS.upsert(evt)
+    if seq:
+        EVENT_HUB.publish(seq, evt)
+    return seq
 
 def _override_from_database_url(db_url: str):
     try:
@@ -113,6 +649,72 @@ def _load_backend_env():
                     elif key == 'EMITTER_WEBHOOK_URL':
                         global WEBHOOK_URL
                         WEBHOOK_URL = val or WEBHOOK_URL
+                    elif key == 'EMITTER_WEBHOOK_BATCH_SIZE':
+                        global WEBHOOK_BATCH_SIZE
+                        try:
+                            WEBHOOK_BATCH_SIZE = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_WEBHOOK_FLUSH_SECONDS':
+                        global WEBHOOK_FLUSH_SECONDS
+                        try:
+                            WEBHOOK_FLUSH_SECONDS = float(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_WEBHOOK_RETRIES':
+                        global WEBHOOK_RETRIES
+                        try:
+                            WEBHOOK_RETRIES = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_WEBHOOK_MAX_PENDING':
+                        global WEBHOOK_MAX_PENDING
+                        try:
+                            WEBHOOK_MAX_PENDING = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_WEBHOOK_SPOOL':
+                        global WEBHOOK_SPOOL_PATH
+                        WEBHOOK_SPOOL_PATH = val or WEBHOOK_SPOOL_PATH
+                    elif key == 'EMITTER_JOURNAL_PATH':
+                        global JOURNAL_PATH
+                        JOURNAL_PATH = val or JOURNAL_PATH
+                    elif key == 'EMITTER_JOURNAL_RETENTION_SECONDS':
+                        global JOURNAL_RETENTION_SECONDS
+                        try:
+                            JOURNAL_RETENTION_SECONDS = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_CLUSTER_PARTITIONS':
+                        global CLUSTER_PARTITIONS
+                        try:
+                            CLUSTER_PARTITIONS = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_INSTANCE_ID':
+                        global CLUSTER_INSTANCE_ID
+                        CLUSTER_INSTANCE_ID = val or CLUSTER_INSTANCE_ID
+                    elif key == 'EMITTER_CLUSTER_LEASE_SECONDS':
+                        global CLUSTER_LEASE_SECONDS
+                        try:
+                            CLUSTER_LEASE_SECONDS = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_CLUSTER_ADDRESS':
+                        global CLUSTER_ADDRESS
+                        CLUSTER_ADDRESS = val or CLUSTER_ADDRESS
+                    elif key == 'EMITTER_COALESCE_SECONDS':
+                        global COALESCE_SECONDS
+                        try:
+                            COALESCE_SECONDS = float(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_COALESCE_CHANNELS':
+                        global COALESCE_CHANNELS
+                        COALESCE_CHANNELS = val or ''
+                    elif key == 'EMITTER_DATA_DIR':
+                        global DATA_DIR
+                        DATA_DIR = val or DATA_DIR
                     elif key == 'EMITTER_HTTP_PORT':
                         global HTTP_PORT
                         try:
@@ -122,18 +724,69 @@ def _load_backend_env():
                     elif key == 'EMITTER_BIND_HOST':
                         global BIND_HOST
                         BIND_HOST = val or BIND_HOST
+                    elif key == 'EMITTER_HTTP_MODE':
+                        global HTTP_MODE
+                        HTTP_MODE = (val or HTTP_MODE).strip().lower()
+                    elif key == 'EMITTER_HTTP_WORKERS':
+                        global HTTP_WORKERS
+                        try:
+                            HTTP_WORKERS = max(1, int(val))
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_HTTP_KEEPALIVE_SECONDS':
+                        global HTTP_KEEPALIVE_SECONDS
+                        try:
+                            HTTP_KEEPALIVE_SECONDS = float(val)
+                        except Exception:
+                            pass
                     elif key == 'EMITTER_POLL_INTERVAL':
                         global POLL_INTERVAL
                         try:
                             POLL_INTERVAL = int(val)
                         except Exception:
                             pass
+                    elif key == 'EMITTER_POLL_MIN_INTERVAL':
+                        global POLL_MIN_INTERVAL
+                        try:
+                            POLL_MIN_INTERVAL = float(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_POLL_MAX_INTERVAL':
+                        global POLL_MAX_INTERVAL
+                        try:
+                            POLL_MAX_INTERVAL = float(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_POLL_BACKOFF':
+                        global POLL_BACKOFF
+                        try:
+                            POLL_BACKOFF = float(val)
+                        except Exception:
+                            pass
                     elif key == 'EMITTER_LOOKBACK_SECONDS':
                         global LOOKBACK_SECONDS
                         try:
                             LOOKBACK_SECONDS = int(val)
                         except Exception:
                             pass
+                    elif key == 'EMITTER_FETCH_PAGE_SIZE':
+                        global FETCH_PAGE_SIZE
+                        try:
+                            FETCH_PAGE_SIZE = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_DB_POOL_SIZE':
+                        global DB_POOL_SIZE
+                        try:
+                            DB_POOL_SIZE = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_DB_POOL_TIMEOUT':
+                        global DB_POOL_TIMEOUT
+                        try:
+                            DB_POOL_TIMEOUT = float(val)
+                        except Exception:
+                            pass
                     elif key == 'APNS_AUTH_KEY_PATH':
                         global APNS_AUTH_KEY_PATH
                         APNS_AUTH_KEY_PATH = val or APNS_AUTH_KEY_PATH
@@ -152,6 +805,75 @@ def _load_backend_env():
                     elif key == 'APNS_DEVICE_TOKENS':
                         global DEVICE_TOKENS
                         DEVICE_TOKENS = [t.strip() for t in (val or '').split(',') if t.strip()]
+                    elif key == 'EMITTER_APNS_CONCURRENCY':
+                        global APNS_CONCURRENCY
+                        try:
+                            APNS_CONCURRENCY = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_APNS_BATCH_SIZE':
+                        global APNS_BATCH_SIZE
+                        try:
+                            APNS_BATCH_SIZE = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_APNS_DEAD_TTL':
+                        global APNS_DEAD_TTL
+                        try:
+                            APNS_DEAD_TTL = float(val)
+                            APNS_FEEDBACK.dead_ttl = APNS_DEAD_TTL
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_DELIVERY_WORKERS':
+                        global DELIVERY_WORKERS
+                        try:
+                            DELIVERY_WORKERS = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_DELIVERY_QUEUE_SIZE':
+                        global DELIVERY_QUEUE_SIZE
+                        try:
+                            DELIVERY_QUEUE_SIZE = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_STREAM_MAX_SUBSCRIBERS':
+                        global STREAM_MAX_SUBSCRIBERS
+                        try:
+                            STREAM_MAX_SUBSCRIBERS = int(val)
+                            EVENT_HUB.max_subscribers = STREAM_MAX_SUBSCRIBERS
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_RECENT_EVENTS_CAPACITY':
+                        try:
+                            RECENT_EVENTS.capacity = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_TRACKING_CAPACITY':
+                        try:
+                            TRACKER.capacity = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_BATCH_MAX_EVENTS':
+                        global BATCH_MAX_EVENTS
+                        try:
+                            BATCH_MAX_EVENTS = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_RECIPIENT_CACHE_TTL':
+                        try:
+                            RECIPIENT_CACHE.ttl = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_RECIPIENT_CACHE_CHANNELS':
+                        try:
+                            RECIPIENT_CACHE.max_channels = int(val)
+                        except Exception:
+                            pass
+                    elif key == 'EMITTER_RECIPIENT_CACHE_HANDLES':
+                        try:
+                            RECIPIENT_CACHE.max_handles = int(val)
+                        except Exception:
+                            pass
         except Exception:
             pass
 
@@ -160,22 +882,489 @@ def connect_db():
         raise RuntimeError('PyMySQL no instalado')
     return pymysql.connect(host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME, port=DB_PORT, autocommit=True, cursorclass=pymysql.cursors.DictCursor)
 
-def fetch_messages_since(conn, since_dt):
-    q = "SELECT id, channel_id, content, created_at, event_at FROM tify_messages WHERE created_at > %s ORDER BY created_at ASC"
-    with conn.cursor() as cur:
-        cur.execute(q, (since_dt,))
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+# pymysql connections are not thread-safe: every thread checks one out for the
+# duration of its work. Idle connections are pinged before reuse, dead ones are
+# replaced, and failed connects back off exponentially up to DB_MAX_BACKOFF.
+class DbPool:
+    def __init__(self, connect, size=4, timeout=10, ping_after=30):
+        self._connect = connect
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._idle = deque()
+        self._created = 0
+        self._cond = threading.Condition()
+        self._backoff = 0
+        self._retry_at = 0.0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.connect_failures = 0
+        self.discarded = 0
+
+    def _open(self):
+        now = time.monotonic()
+        with self._cond:
+            if now < self._retry_at:
+                self._created -= 1
+                self._cond.notify()
+                raise RuntimeError(f'DB unavailable, retrying in {self._retry_at - now:.1f}s')
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self.connect_failures += 1
+                self._backoff = min(DB_MAX_BACKOFF, self._backoff * 2 if self._backoff else 1)
+                self._retry_at = time.monotonic() + self._backoff
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.connects += 1
+            self._backoff = 0
+            self._retry_at = 0.0
+        return conn
+
+    def _alive(self, conn, idle_since):
+        if not getattr(conn, 'open', True):
+            return False
+        if time.monotonic() - idle_since < self.ping_after:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        t0 = time.monotonic()
+        deadline = t0 + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise TimeoutError('DB pool exhausted')
+                waited = True
+                self._cond.wait(remaining)
+            elapsed = time.monotonic() - t0
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_seconds += elapsed
+                self.max_wait = max(self.max_wait, elapsed)
+        if conn is not None and not self._alive(conn, idle_since):
+            self._discard(conn, reserve=True)
+            conn = None
+        if conn is None:
+            conn = self._open()
+        return conn
+
+    def _discard(self, conn, reserve=False):
+        _close_quietly(conn)
+        with self._cond:
+            self.discarded += 1
+            if not reserve:
+                self._created -= 1
+                self._cond.notify()
+
+    def release(self, conn, broken=False):
+        if broken or not getattr(conn, 'open', True):
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException as e:
+            self.release(conn, broken=not isinstance(e, Exception) or _is_connection_error(e))
+            raise
+        else:
+            self.release(conn)
+
+    def close(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._created -= len(idle)
+        for conn, _ in idle:
+            _close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._created,
+                'idle': len(self._idle),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'waitSeconds': round(self.wait_seconds, 3),
+                'maxWaitSeconds': round(self.max_wait, 3),
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'connectFailures': self.connect_failures,
+                'discarded': self.discarded,
+                'backoffSeconds': self._backoff
+            }
+
+def _is_connection_error(e):
+    if isinstance(e, (OSError, TimeoutError)):
+        return True
+    if pymysql is not None:
+        return isinstance(e, (pymysql.err.OperationalError, pymysql.err.InterfaceError))
+    return False
+
+DB_POOL = None
+
+def _stream_cursor(conn):
+    # Unbuffered cursor: rows are read off the socket as they are consumed.
+    cls = getattr(pymysql.cursors, 'SSDictCursor', None) if pymysql is not None else None
+    return conn.cursor(cls) if cls is not None else conn.cursor()
+
+def fetch_messages_since(conn, since_dt, since_id=None, limit=None, partitions=None, modulus=None):
+    cols = "SELECT id, channel_id, content, created_at, event_at, is_emergency, priority FROM tify_messages"
+    if since_id is None:
+        where = "created_at > %s"
+        args = (since_dt,)
+    else:
+        where = "(created_at > %s OR (created_at = %s AND id > %s))"
+        args = (since_dt, since_dt, since_id)
+    if partitions is not None:
+        # Same hash as channel_partition(): MySQL CRC32 over the utf-8 channel id.
+        where += f" AND MOD(CRC32(channel_id), %s) IN ({','.join(['%s'] * len(partitions))})"
+        args += (int(modulus),) + tuple(partitions)
+    q = f"{cols} WHERE {where} ORDER BY created_at ASC, id ASC"
+    if limit:
+        q += " LIMIT %s"
+        args += (int(limit),)
+    with _stream_cursor(conn) as cur:
+        cur.execute(q, args)
         return cur.fetchall()
 
+def iter_message_pages(conn, since, page_size=None, partitions=None, modulus=None):
+    since_dt, since_id = since
+    size = max(1, int(page_size or FETCH_PAGE_SIZE))
+    while True:
+        rows = fetch_messages_since(conn, since_dt, since_id, size, partitions, modulus)
+        if rows:
+            yield rows
+        if len(rows) < size:
+            return
+        since_dt, since_id = rows[-1]['created_at'], rows[-1]['id']
+
+def _apns_reason(result):
+    if isinstance(result, tuple):
+        result = result[0] if result else None
+    return str(result) if result else 'Unknown'
+
+# Each worker thread owns one APNs client (one HTTP/2 connection). Chunks go out as
+# multiplexed streams via send_notification_batch when the client supports it.
+class ApnsFanout:
+    def __init__(self, client_factory, concurrency=8, batch_size=500):
+        self._factory = client_factory
+        self._local = threading.local()
+        self.concurrency = max(1, int(concurrency))
+        self.batch_size = max(1, int(batch_size))
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='apns')
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._factory()
+            self._local.client = client
+        return client
+
+    def _drop_client(self):
+        self._local.client = None
+
+    def _send_chunk(self, tokens, payload, topic, collapse_id=None):
+        try:
+            client = self._client()
+        except Exception as e:
+            return {t: type(e).__name__ for t in tokens}
+        if Notification is not None and hasattr(client, 'send_notification_batch'):
+            try:
+                res = client.send_notification_batch([Notification(token=t, payload=payload) for t in tokens], topic, collapse_id=collapse_id)
+                return {t: _apns_reason(res.get(t)) for t in tokens}
+            except Exception as e:
+                self._drop_client()
+                return {t: type(e).__name__ for t in tokens}
+        results = {}
+        for token in tokens:
+            try:
+                client.send_notification(token, payload, topic, collapse_id=collapse_id)
+                results[token] = 'Success'
+            except Exception as e:
+                results[token] = type(e).__name__
+                if APNsException is None or not isinstance(e, APNsException):
+                    # Transport failure: reconnect for the rest of the chunk.
+                    self._drop_client()
+                    try:
+                        client = self._client()
+                    except Exception:
+                        pass
+        return results
+
+    def send(self, tokens, payload, topic, collapse_id=None):
+        size = self.batch_size
+        if len(tokens) > size * self.concurrency:
+            chunks = [tokens[i:i + size] for i in range(0, len(tokens), size)]
+        else:
+            # Small fan-out: spread evenly so every connection gets work.
+            step = max(1, -(-len(tokens) // self.concurrency))
+            chunks = [tokens[i:i + step] for i in range(0, len(tokens), step)]
+        results = {}
+        for fut in [self._executor.submit(self._send_chunk, c, payload, topic, collapse_id) for c in chunks]:
+            results.update(fut.result())
+        return results
+
 def init_apns():
     if APNsClient is None or Payload is None or TokenCredentials is None:
         return None
     if not (APNS_AUTH_KEY_PATH and APNS_KEY_ID and APNS_TEAM_ID):
         return None
     creds = TokenCredentials(auth_key_path=APNS_AUTH_KEY_PATH, key_id=APNS_KEY_ID, team_id=APNS_TEAM_ID)
-    return APNsClient(credentials=creds, use_sandbox=APNS_USE_SANDBOX)
+    return ApnsFanout(lambda: APNsClient(credentials=creds, use_sandbox=APNS_USE_SANDBOX), APNS_CONCURRENCY, APNS_BATCH_SIZE)
 
-def notify_webhook(message):
+# Keep-alive session to the webhook. With batch_size > 0 events are buffered and
+# POSTed as a JSON array when the batch fills or flush_seconds pass; otherwise each
+# event is POSTed on its own by pool_size threads. Either way send() only queues, so
+# a slow webhook never holds up the delivery worker's APNs push. At most max_pending
+# events wait; beyond that, and whatever is still waiting when close() gives up, goes
+# straight to the JSONL dead-letter spool. Failed POSTs are retried with exponential
+# backoff and full jitter, then spooled too.
+class WebhookSender:
+    def __init__(self, url, batch_size=0, flush_seconds=1.0, retries=4, timeout=5, spool_path=None, pool_size=4,
+                 max_pending=10000):
+        self.url = url
+        self.batch_size = max(0, batch_size)
+        self.flush_seconds = max(0.01, flush_seconds)
+        self.retries = max(0, retries)
+        self.timeout = timeout
+        self.spool_path = spool_path
+        self.max_pending = max(1, max_pending)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._buffer = []
+        self._first_at = None
+        self._cond = threading.Condition()
+        self._spool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._closed = False
+        self._abandon = threading.Event()
+        self._threads = []
+        self._queue = None
+        self.posts = 0
+        self.events = 0
+        self.retried = 0
+        self.failed = 0
+        self.spooled = 0
+        self.overflowed = 0
+        if self.batch_size:
+            self._threads.append(threading.Thread(target=self._run, name='webhook-flush', daemon=True))
+        else:
+            self._queue = queue.Queue(maxsize=self.max_pending)
+            for i in range(max(1, pool_size)):
+                self._threads.append(threading.Thread(target=self._post_each, name=f'webhook-{i}', daemon=True))
+        for t in self._threads:
+            t.start()
+
+    def send(self, event):
+        # False when the event went to the spool instead of the queue.
+        if not self.batch_size:
+            try:
+                self._queue.put_nowait(event)
+                return True
+            except queue.Full:
+                pass
+        else:
+            with self._cond:
+                if len(self._buffer) < self.max_pending:
+                    self._buffer.append(event)
+                    if self._first_at is None:
+                        self._first_at = time.monotonic()
+                    if len(self._buffer) >= self.batch_size:
+                        self._cond.notify()
+                    return True
+        with self._stats_lock:
+            self.overflowed += 1
+        M_WEBHOOK_RESULTS.inc(result='overflow')
+        self._spool([event], 'queue full')
+        return False
+
+    def _post_each(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                return
+            if self._abandon.is_set():
+                self._spool([event], 'shutdown')
+            else:
+                self._deliver(event, [event])
+
+    def _take(self):
+        batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+        self._first_at = time.monotonic() if self._buffer else None
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and len(self._buffer) < self.batch_size:
+                    if self._first_at is None:
+                        self._cond.wait()
+                        continue
+                    remaining = self._first_at + self.flush_seconds - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._abandon.is_set():
+                    return
+                batch = self._take()
+                done = self._closed and not self._buffer
+            if batch:
+                self._deliver(batch, batch)
+            if done:
+                return
+
+    def _deliver(self, body, events):
+        t0 = time.monotonic()
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt and self._abandon.is_set():
+                error = error or 'shutdown'
+                break
+            if attempt:
+                with self._stats_lock:
+                    self.retried += 1
+                time.sleep(random.uniform(0, min(WEBHOOK_MAX_BACKOFF, 0.2 * (2 ** attempt))))
+            try:
+                r = self.session.post(self.url, json=body, timeout=self.timeout)
+                if 200 <= r.status_code < 300:
+                    elapsed = time.monotonic() - t0
+                    with self._stats_lock:
+                        self.posts += 1
+                        self.events += len(events)
+                        self._latencies.append(elapsed)
+                    M_WEBHOOK_SEND.observe(elapsed)
+                    M_WEBHOOK_RESULTS.inc(len(events), result='ok')
+                    return True
+                error = f'HTTP {r.status_code}'
+                # Client errors other than timeouts/throttling will not succeed on retry.
+                if 400 <= r.status_code < 500 and r.status_code not in (408, 429):
+                    break
+            except Exception as e:
+                error = type(e).__name__
+        with self._stats_lock:
+            self.failed += len(events)
+        M_WEBHOOK_SEND.observe(time.monotonic() - t0)
+        M_WEBHOOK_RESULTS.inc(len(events), result='failed')
+        self._spool(events, error)
+        return False
+
+    def _spool(self, events, error):
+        if not self.spool_path:
+            return
+        try:
+            with self._spool_lock:
+                os.makedirs(os.path.dirname(self.spool_path) or '.', exist_ok=True)
+                with open(self.spool_path, 'a') as f:
+                    failed_at = datetime.now(timezone.utc).isoformat()
+                    for event in events:
+                        f.write(json.dumps({'failedAt': failed_at, 'error': error, 'event': event}) + '\n')
+                self.spooled += len(events)
+        except Exception:
+            M_ERRORS.inc(stage='webhook_spool')
+
+    def close(self, timeout=WEBHOOK_CLOSE_SECONDS):
+        # Keeps posting for up to `timeout` seconds, then spools what is left.
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._queue is not None:
+            for _ in self._threads:
+                try:
+                    self._queue.put(None, timeout=0.1)
+                except queue.Full:
+                    break
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0, deadline - time.monotonic()))
+        self._abandon.set()
+        left = []
+        with self._cond:
+            left, self._buffer = self._buffer, []
+        while self._queue is not None:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is not None:
+                left.append(event)
+        if left:
+            self._spool(left, 'shutdown')
+        if self._queue is not None:
+            for _ in self._threads:
+                try:
+                    self._queue.put_nowait(None)
+                except queue.Full:
+                    break
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = list(self._latencies)
+        return {
+            'batchSize': self.batch_size,
+            'buffered': len(self._buffer) + (self._queue.qsize() if self._queue is not None else 0),
+            'maxPending': self.max_pending,
+            'overflowed': self.overflowed,
+            'posts': self.posts,
+            'events': self.events,
+            'retries': self.retried,
+            'failed': self.failed,
+            'spooled': self.spooled,
+            'latencySeconds': {
+                'p50': round(_percentile(latencies, 50), 4),
+                'p99': round(_percentile(latencies, 99), 4)
+            }
+        }
+
+WEBHOOK_SENDER = None
+
+def init_webhook():
     if requests is None or not WEBHOOK_URL:
+        return None
+    spool = WEBHOOK_SPOOL_PATH or os.path.join(DATA_DIR, 'webhook-dead-letter.jsonl')
+    return WebhookSender(WEBHOOK_URL, WEBHOOK_BATCH_SIZE, WEBHOOK_FLUSH_SECONDS, WEBHOOK_RETRIES, WEBHOOK_TIMEOUT, spool, DELIVERY_WORKERS,
+                         WEBHOOK_MAX_PENDING)
+
+def notify_webhook(message):
+    if WEBHOOK_SENDER is None:
         return False
     try:
         payload = {
@@ -185,29 +1374,194 @@ def notify_webhook(message):
             'content': message['content'],
             'createdAt': message['created_at'].isoformat() if hasattr(message['created_at'], 'isoformat') else str(message['created_at'])
         }
-        r = requests.post(WEBHOOK_URL, json=payload, timeout=5)
-        return r.status_code >= 200 and r.status_code < 300
+        return WEBHOOK_SENDER.send(payload)
     except Exception:
         return False
 
-def notify_apns(client, content, tokens):
-    if client is None or not APNS_TOPIC:
-        return False
-    tokens = [t for t in (tokens or []) if t]
-    if not tokens:
-        return False
-    try:
-        alert = {'title': 'Emergencia', 'body': content}
-        payload = Payload(alert=alert, sound='default', badge=1)
-        ok = True
-        for token in tokens:
+APNS_INVALID_REASONS = frozenset(('Unregistered', 'BadDeviceToken', 'DeviceTokenNotForTopic'))
+# Only Unregistered proves the device dropped the token. The other two also come back
+# for every token when APNS_ENV or APNS_TOPIC is wrong, so they are skipped in memory
+# but never written to the database.
+APNS_PRUNE_REASONS = frozenset(('Unregistered',))
+APNS_RETRYABLE_REASONS = frozenset(('TooManyRequests', 'InternalServerError', 'ServiceUnavailable', 'Shutdown', 'IdleTimeout', 'ConnectionError', 'ConnectionFailed', 'TimeoutError', 'OSError'))
+
+def classify_apns(reason):
+    if reason == 'Success':
+        return 'success'
+    if reason in APNS_INVALID_REASONS:
+        return 'invalid'
+    if reason in APNS_RETRYABLE_REASONS:
+        return 'retryable'
+    return 'failed'
+
+# Per-token APNs outcomes. Invalid handles are skipped at once and dropped from the
+# recipient cache. Unregistered ones are also dropped from DEVICE_TOKENS and disabled
+# in the database in batches by flush() (called once per poll cycle). Jobs already
+# queued or held by the coalescer still carry them, so they stay skipped for dead_ttl
+# seconds (after the update, for pruned ones), or until revive() hears the device
+# registered the handle again.
+class ApnsFeedback:
+    def __init__(self, batch_size=500, dead_ttl=3600):
+        self.batch_size = max(1, batch_size)
+        self.dead_ttl = dead_ttl
+        self._dead = {}
+        self._pending = []
+        self._lock = threading.Lock()
+        self.counts = {'success': 0, 'invalid': 0, 'retryable': 0, 'failed': 0}
+        self.duplicates = 0
+        self.dead_skipped = 0
+        self.disabled = 0
+        self.prune_errors = 0
+
+    def filter(self, tokens):
+        unique = list(dict.fromkeys(t for t in tokens if t))
+        duplicates = len(tokens) - len(unique)
+        with self._lock:
+            if self._dead:
+                now = time.monotonic()
+                live = [t for t in unique if self._dead.get(t, 0) <= now]
+            else:
+                live = unique
+            dead = len(unique) - len(live)
+            self.duplicates += duplicates
+            self.dead_skipped += dead
+        if duplicates:
+            M_APNS_WASTED.inc(duplicates, kind='duplicate')
+        if dead:
+            M_APNS_WASTED.inc(dead, kind='dead')
+        return live
+
+    def record(self, results):
+        invalid = []
+        prune = set()
+        counts = {}
+        for token, reason in results.items():
+            kind = classify_apns(reason)
+            counts[kind] = counts.get(kind, 0) + 1
+            if kind == 'invalid':
+                invalid.append(token)
+                if reason in APNS_PRUNE_REASONS:
+                    prune.add(token)
+        with self._lock:
+            for kind, n in counts.items():
+                self.counts[kind] += n
+            now = time.monotonic()
+            fresh = [t for t in invalid if self._dead.get(t, 0) <= now]
+            for t in fresh:
+                # Pruned handles are held until flush() has disabled the row; the TTL
+                # starts from there.
+                self._dead[t] = float('inf') if t in prune else now + self.dead_ttl
+            self._pending.extend(t for t in fresh if t in prune)
+        if invalid:
+            M_APNS_WASTED.inc(len(invalid), kind='invalid')
+        if fresh:
+            RECIPIENT_CACHE.drop_handles(fresh)
+            _drop_device_tokens([t for t in fresh if t in prune])
+        return invalid
+
+    def flush(self, conn):
+        while True:
+            with self._lock:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+            if not batch:
+                return
             try:
-                client.send_notification(token, payload, APNS_TOPIC)
+                marks = ','.join(['%s'] * len(batch))
+                with conn.cursor() as cur:
+                    cur.execute(f"UPDATE tify_user_messaging_settings SET is_enabled = 0 WHERE platform = 'PUSH' AND handle IN ({marks})", tuple(batch))
             except Exception:
-                ok = False
-        return ok
-    except Exception:
-        return False
+                with self._lock:
+                    self._pending[:0] = batch
+                    self.prune_errors += 1
+                raise
+            RECIPIENT_CACHE.drop_handles(batch)
+            with self._lock:
+                expires = time.monotonic() + self.dead_ttl
+                for t in batch:
+                    if t in self._dead:
+                        self._dead[t] = expires
+                self.disabled += len(batch)
+                self._expire()
+
+    def _expire(self):
+        now = time.monotonic()
+        for t in [t for t, expires in self._dead.items() if expires <= now]:
+            del self._dead[t]
+
+    def revive(self, handles):
+        # A device registered these handles again (POST /cache/invalidate with a
+        # handle): stop skipping them and do not disable a row that is re-enabled.
+        handles = set(h for h in handles if h)
+        if not handles:
+            return
+        with self._lock:
+            for t in handles:
+                self._dead.pop(t, None)
+            self._pending = [t for t in self._pending if t not in handles]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'results': dict(self.counts),
+                'duplicatesSkipped': self.duplicates,
+                'deadSkipped': self.dead_skipped,
+                'disabledHandles': self.disabled,
+                'deadHandles': len(self._dead),
+                'pendingDisable': len(self._pending),
+                'pruneErrors': self.prune_errors
+            }
+
+APNS_FEEDBACK = ApnsFeedback(APNS_PRUNE_BATCH, APNS_DEAD_TTL)
+
+def _drop_device_tokens(handles):
+    global DEVICE_TOKENS
+    handles = set(handles)
+    if DEVICE_TOKENS and not handles.isdisjoint(DEVICE_TOKENS):
+        DEVICE_TOKENS = [t for t in DEVICE_TOKENS if t not in handles]
+
+def apns_collapse_id(channel_id):
+    # APNs caps apns-collapse-id at 64 bytes.
+    return f"tify-{channel_id}"[:64] if channel_id else None
+
+def fanout_apns(client, content, tokens, channel_id=None, badge=1, collapse=False):
+    if client is None or not APNS_TOPIC:
+        return {}
+    tokens = APNS_FEEDBACK.filter(tokens or [])
+    if not tokens:
+        return {}
+    try:
+        alert = {'title': 'Emergencia', 'body': content}
+        if channel_id:
+            # thread-id groups a channel's notifications; the collapse id makes a newer
+            # push replace the previous one instead of stacking.
+            payload = Payload(alert=alert, sound='default', badge=badge, thread_id=channel_id)
+            t0 = time.perf_counter()
+            results = client.send(tokens, payload, APNS_TOPIC, collapse_id=apns_collapse_id(channel_id) if collapse else None)
+        else:
+            payload = Payload(alert=alert, sound='default', badge=badge)
+            t0 = time.perf_counter()
+            results = client.send(tokens, payload, APNS_TOPIC)
+        M_APNS_SEND.observe(time.perf_counter() - t0)
+    except Exception as e:
+        M_ERRORS.inc(stage='apns')
+        results = {t: type(e).__name__ for t in tokens}
+    for reason, count in summarize_apns(results).items():
+        M_APNS_RESULTS.inc(count, reason=reason)
+    APNS_FEEDBACK.record(results)
+    return results
+
+def summarize_apns(results):
+    counts = {}
+    for reason in (results or {}).values():
+        counts[reason] = counts.get(reason, 0) + 1
+    return counts
+
+def notify_apns(client, content, tokens, channel_id=None, badge=1, collapse=False):
+    # True when at least one device accepted the push. Invalid handles are pruned by
+    # APNS_FEEDBACK and do not fail the message on their own.
+    results = fanout_apns(client, content, tokens, channel_id, badge, collapse)
+    return any(r == 'Success' for r in results.values())
 
 def load_device_tokens(conn):
     try:
@@ -218,214 +1572,1872 @@ def load_device_tokens(conn):
     except Exception:
         return []
 
-def get_recipient_tokens(conn, channel_id, created_at_iso):
+def _naive_utc(dt):
+    if isinstance(dt, datetime) and dt.tzinfo is not None:
+        return dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+def _parse_created_at(created_at_iso):
     try:
         created_dt = datetime.fromisoformat(created_at_iso.replace('Z', '+00:00')) if isinstance(created_at_iso, str) else created_at_iso
     except Exception:
         created_dt = None
-    try:
-        with conn.cursor() as cur:
+    return _naive_utc(created_dt) if isinstance(created_dt, datetime) else None
+
+# Per-channel (handle, subscribed_at) lists. Entries hold every active PUSH recipient
+# of the channel; the subscribed_at <= created_at cutoff is applied per message.
+class RecipientCache:
+    def __init__(self, ttl=60, max_channels=1000, max_handles=500000):
+        self.ttl = ttl
+        self.max_channels = max_channels
+        self.max_handles = max_handles
+        self._entries = OrderedDict()
+        self._handles = 0
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def epoch(self):
+        return self._epoch
+
+    def _remove(self, channel_id):
+        entry = self._entries.pop(channel_id, None)
+        if entry is not None:
+            self._handles -= len(entry[1])
+
+    def get(self, channel_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(channel_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(channel_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._remove(channel_id)
+            self.misses += 1
+            return None
+
+    def put(self, channel_id, recipients, epoch=None):
+        recipients = tuple(recipients)
+        if self.ttl <= 0 or len(recipients) > self.max_handles:
+            return
+        with self._lock:
+            # Skip results loaded before an invalidation landed.
+            if epoch is not None and epoch != self._epoch:
+                return
+            self._remove(channel_id)
+            self._entries[channel_id] = (time.monotonic(), recipients)
+            self._handles += len(recipients)
+            while self._entries and (len(self._entries) > self.max_channels or self._handles > self.max_handles):
+                _, old = self._entries.popitem(last=False)
+                self._handles -= len(old[1])
+                self.evictions += 1
+
+    def drop_handles(self, handles):
+        handles = set(handles)
+        if not handles:
+            return
+        with self._lock:
+            self._epoch += 1
+            for channel_id, (loaded_at, recipients) in list(self._entries.items()):
+                kept = tuple(r for r in recipients if r[0] not in handles)
+                if len(kept) != len(recipients):
+                    self._entries[channel_id] = (loaded_at, kept)
+                    self._handles -= len(recipients) - len(kept)
+
+    def invalidate(self, channel_id=None):
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += 1
+            if channel_id is None:
+                self._entries.clear()
+                self._handles = 0
+            else:
+                self._remove(channel_id)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'channels': len(self._entries),
+                'handles': self._handles,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / total, 4) if total else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'ttl': self.ttl
+            }
+
+RECIPIENT_CACHE = RecipientCache(RECIPIENT_CACHE_TTL, RECIPIENT_CACHE_CHANNELS, RECIPIENT_CACHE_HANDLES)
+
+RECIPIENT_QUERY_CHUNK = 500
+
+def load_channel_recipients(conn, channel_ids):
+    grouped = {cid: [] for cid in channel_ids}
+    ids = list(grouped)
+    with conn.cursor() as cur:
+        for i in range(0, len(ids), RECIPIENT_QUERY_CHUNK):
+            chunk = ids[i:i + RECIPIENT_QUERY_CHUNK]
+            marks = ','.join(['%s'] * len(chunk))
             cur.execute(
-                """
-                SELECT ums.handle
+                f"""
+                SELECT cs.channel_id, ums.handle, cs.subscribed_at
                 FROM tify_channel_subscriptions cs
                 JOIN tify_user_messaging_settings ums ON ums.user_id = cs.user_id
-                WHERE cs.channel_id = %s
+                WHERE cs.channel_id IN ({marks})
                   AND cs.is_active = 1
                   AND cs.receive_messages = 1
                   AND ums.platform = 'PUSH'
                   AND ums.is_enabled = 1
                   AND ums.handle IS NOT NULL
-                  AND (%s IS NULL OR cs.subscribed_at <= %s)
                 """,
-                (channel_id, created_dt, created_dt)
+                tuple(chunk)
             )
-            rows = cur.fetchall()
-            return [r['handle'] for r in rows]
+            for r in cur.fetchall():
+                grouped.setdefault(r['channel_id'], []).append((r['handle'], _naive_utc(r['subscribed_at'])))
+    # A handle shared by several users (or settings rows) is sent once, from its
+    # earliest subscription.
+    for cid, recipients in grouped.items():
+        earliest = {}
+        for handle, sub in recipients:
+            prev = earliest.get(handle, False)
+            if prev is False or (prev is not None and (sub is None or sub < prev)):
+                earliest[handle] = sub
+        if len(earliest) != len(recipients):
+            grouped[cid] = list(earliest.items())
+    return grouped
+
+def resolve_recipients(conn, channel_ids):
+    resolved = {}
+    missing = []
+    for cid in dict.fromkeys(channel_ids):
+        cached = RECIPIENT_CACHE.get(cid)
+        if cached is None:
+            missing.append(cid)
+        else:
+            resolved[cid] = cached
+    if missing:
+        epoch = RECIPIENT_CACHE.epoch
+        t0 = time.perf_counter()
+        loaded = load_channel_recipients(conn, missing)
+        M_RECIPIENT_QUERY.observe(time.perf_counter() - t0)
+        for cid in missing:
+            RECIPIENT_CACHE.put(cid, loaded[cid], epoch)
+            resolved[cid] = loaded[cid]
+    return resolved
+
+def _filter_recipients(recipients, created_dt):
+    if created_dt is None:
+        return [h for h, _ in recipients]
+    return [h for h, sub in recipients if sub is None or sub <= created_dt]
+
+def get_recipient_tokens(conn, channel_id, created_at_iso):
+    # None when the lookup failed, so callers can tell it apart from "no recipients".
+    try:
+        recipients = resolve_recipients(conn, [channel_id]).get(channel_id, ())
     except Exception:
-        return []
+        M_ERRORS.inc(stage='recipients')
+        return None
+    return _filter_recipients(recipients, _parse_created_at(created_at_iso))
 
-class Handler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        if self.path == '/health':
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(b'{"status":"ok"}')
-            return
-        if self.path == '/events':
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+# Returned by a pipeline handler that finishes the job later through complete().
+DEFERRED = object()
+
+# One bounded queue per worker. A channel always hashes to the same worker, so its
+# messages go out in ingest order; submit() blocks while that queue is full.
+class DeliveryPipeline:
+    def __init__(self, handler, workers=4, queue_size=1000, on_done=None):
+        self._handler = handler
+        self._on_done = on_done
+        self._queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in range(max(1, workers))]
+        self._threads = []
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self.submitted = 0
+        self.rejected = 0
+        self.delivered = 0
+        self.failed = 0
+        self.blocked_seconds = 0.0
+
+    def start(self):
+        for i, q in enumerate(self._queues):
+            t = threading.Thread(target=self._run, args=(q,), name=f'delivery-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _queue_for(self, key):
+        return self._queues[zlib.crc32(str(key).encode('utf-8')) % len(self._queues)]
+
+    def submit(self, job, key, timeout=None):
+        # Blocks while the worker's queue is full; with a timeout, gives up and
+        # returns False instead.
+        q = self._queue_for(key)
+        t0 = time.monotonic()
+        try:
+            q.put(job, timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+        waited = time.monotonic() - t0
+        with self._lock:
+            self.submitted += 1
+            self.blocked_seconds += waited
+        return True
+
+    def _run(self, q):
+        while True:
+            job = q.get()
+            if job is None:
+                q.task_done()
+                return
             try:
-                body = json.dumps(RECENT_EVENTS).encode('utf-8')
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Cache-Control', 'no-cache')
-                self.end_headers()
-                self.wfile.write(body)
+                result = self._handler(job)
+                if result is DEFERRED:
+                    q.task_done()
+                    continue
+                ok = bool(result)
             except Exception:
-                self.send_response(500)
-                self.end_headers()
-            return
-        self.send_response(404)
-        self.end_headers()
+                ok = False
+            q.task_done()
+            self.complete(job, ok)
 
-    def do_POST(self):
+    def complete(self, job, ok):
+        if self._on_done is not None:
+            try:
+                self._on_done(job, ok)
+            except Exception:
+                pass
+        created = _naive_utc(job.get('createdAt'))
+        latency = None
+        if isinstance(created, datetime):
+            latency = (datetime.now(timezone.utc).replace(tzinfo=None) - created).total_seconds()
+        with self._lock:
+            if ok:
+                self.delivered += 1
+            else:
+                self.failed += 1
+            if latency is not None:
+                self._latencies.append(latency)
+        if not ok:
+            M_ERRORS.inc(stage='delivery')
+        if latency is not None:
+            M_DELIVERY_LATENCY.observe(max(0.0, latency))
+
+    def depth(self):
+        return sum(q.qsize() for q in self._queues)
+
+    def join(self):
+        for q in self._queues:
+            q.join()
+
+    def stop(self, timeout=10):
+        for q in self._queues:
+            q.put(None)
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0, deadline - time.monotonic()))
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            return {
+                'workers': len(self._queues),
+                'queueDepth': self.depth(),
+                'queueDepthByWorker': [q.qsize() for q in self._queues],
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'delivered': self.delivered,
+                'failed': self.failed,
+                'blockedSeconds': round(self.blocked_seconds, 3),
+                'latencySeconds': {
+                    'p50': round(_percentile(latencies, 50), 3),
+                    'p99': round(_percentile(latencies, 99), 3),
+                    'max': round(max(latencies), 3) if latencies else 0.0
+                }
+            }
+
+DELIVERY_PIPELINE = None
+GLOBAL_APNS_CLIENT = None
+
+def _parse_coalesce_channels(spec):
+    overrides = {}
+    for item in (spec or '').split(','):
+        cid, sep, seconds = item.strip().rpartition('=')
+        if not sep or not cid:
+            continue
         try:
-            length = int(self.headers.get('Content-Length', '0'))
+            overrides[cid] = float(seconds)
+        except ValueError:
+            pass
+    return overrides
+
+# Per-channel burst coalescing. The first message of a channel goes out at once and
+# opens a window; messages arriving inside it are held (their jobs are DEFERRED, so
+# the checkpoint does not move past them) and go out as one summary push when the
+# window closes, which then opens the next window. Urgent messages never wait.
+class ChannelCoalescer:
+    def __init__(self, window, overrides=None, send=None):
+        self.window = max(0.0, window)
+        self.overrides = dict(overrides or {})
+        self._send = send
+        self._channels = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self.held = 0
+        self.summaries = 0
+        self.saved = 0
+
+    def window_for(self, channel_id):
+        return self.overrides.get(channel_id, self.window)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='coalescer', daemon=True)
+        self._thread.start()
+
+    def offer(self, job):
+        # True when the job was held for the channel's summary.
+        channel_id = job.get('channelId') or (job.get('row') or {}).get('channel_id')
+        window = self.window_for(channel_id)
+        if job.get('urgent') or window <= 0 or not channel_id:
+            return False
+        now = time.monotonic()
+        with self._cond:
+            if self._closed:
+                return False
+            state = self._channels.get(channel_id)
+            if state is None or (now >= state['until'] and not state['jobs']):
+                self._channels[channel_id] = {'until': now + window, 'jobs': []}
+                return False
+            state['jobs'].append(job)
+            self.held += 1
+            self._cond.notify()
+            return True
+
+    def _due(self, now, force=False):
+        due = []
+        for channel_id, state in list(self._channels.items()):
+            if not force and now < state['until']:
+                continue
+            if state['jobs']:
+                due.append((channel_id, state['jobs']))
+                state['jobs'] = []
+                state['until'] = now + self.window_for(channel_id)
+            else:
+                del self._channels[channel_id]
+        return due
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    now = time.monotonic()
+                    due = self._due(now)
+                    if due:
+                        break
+                    pending = [s['until'] for s in self._channels.values() if s['jobs']]
+                    self._cond.wait(max(0.01, min(pending) - now) if pending else None)
+            for channel_id, jobs in due:
+                self._flush(channel_id, jobs)
+
+    def _flush(self, channel_id, jobs):
+        tokens = list(dict.fromkeys(t for job in jobs for t in (job.get('tokens') or ())))
+        if len(jobs) == 1:
+            content = jobs[0]['content']
+        else:
+            content = f"{len(jobs)} mensajes nuevos · {jobs[-1]['content']}"
+        ok = False
+        try:
+            ok = self._send(channel_id, content, tokens, len(jobs)) if tokens else True
         except Exception:
-            length = 0
-        raw = self.rfile.read(length) if length > 0 else b'{}'
+            M_ERRORS.inc(stage='coalesce')
+        saved = sum(len(job.get('tokens') or ()) for job in jobs) - len(tokens)
+        with self._cond:
+            self.summaries += 1
+            self.saved += saved
+        M_COALESCED.inc(len(jobs))
+        if saved > 0:
+            M_COALESCE_SAVED.inc(saved)
+        for job in jobs:
+            job['coalesced'] = len(jobs)
+            if DELIVERY_PIPELINE is not None:
+                DELIVERY_PIPELINE.complete(job, bool(ok))
+        return ok
+
+    def close(self):
+        # Sends whatever is held right away; later offers are sent directly.
+        with self._cond:
+            self._closed = True
+            due = self._due(time.monotonic(), force=True)
+            self._cond.notify_all()
+        for channel_id, jobs in due:
+            self._flush(channel_id, jobs)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'windowSeconds': self.window,
+                'channelOverrides': len(self.overrides),
+                'openWindows': len(self._channels),
+                'heldNow': sum(len(s['jobs']) for s in self._channels.values()),
+                'held': self.held,
+                'summaries': self.summaries,
+                'notificationsSaved': self.saved
+            }
+
+COALESCER = None
+
+def _send_summary(channel_id, content, tokens, count):
+    return notify_apns(GLOBAL_APNS_CLIENT, content, tokens, channel_id, badge=count, collapse=True)
+
+def init_coalescer():
+    overrides = _parse_coalesce_channels(COALESCE_CHANNELS)
+    if COALESCE_SECONDS <= 0 and not any(v > 0 for v in overrides.values()):
+        return None
+    coalescer = ChannelCoalescer(COALESCE_SECONDS, overrides, _send_summary)
+    coalescer.start()
+    print(f"Coalescing window={COALESCE_SECONDS}s overrides={len(overrides)}")
+    return coalescer
+
+# Tracks ingested (created_at, id) keys until delivery finishes. The watermark is the
+# newest key with nothing older still in flight, i.e. the safe restart point. A failed
+# key pins it for the life of the process, so a restart reads that row again.
+class IngestWatermark:
+    def __init__(self):
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self.failed = 0
+
+    def add(self, key):
+        with self._lock:
+            self._pending[key] = False
+
+    def done(self, key):
+        with self._lock:
+            if key in self._pending:
+                self._pending[key] = True
+            advanced = None
+            while self._pending:
+                first = next(iter(self._pending))
+                if not self._pending[first]:
+                    break
+                self._pending.popitem(last=False)
+                advanced = first
+            if self._pending and self._pending[next(iter(self._pending))] is None:
+                # Pinned behind a failure: finished keys can no longer move it.
+                self._pending.pop(key, None)
+            return advanced
+
+    def fail(self, key):
+        with self._lock:
+            self.failed += 1
+            if key not in self._pending:
+                return
+            self._pending[key] = None
+            if self._pending[next(iter(self._pending))] is None:
+                for k in [k for k, v in self._pending.items() if v is True]:
+                    del self._pending[k]
+
+    def idle(self):
+        with self._lock:
+            return not self._pending
+
+    def __len__(self):
+        return len(self._pending)
+
+# Local SQLite (WAL) journal with the ingestion checkpoint and the ids already
+# delivered. On restart the poller resumes from the checkpoint and skips delivered ids,
+# so nothing is replayed or lost across restarts. Old ids are compacted away.
+class DeliveryJournal:
+    def __init__(self, path, retention_seconds=86400):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS checkpoint (slot INTEGER PRIMARY KEY, created_at TEXT NOT NULL, message_id TEXT, updated_at REAL NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS delivered (message_id TEXT PRIMARY KEY, delivered_at REAL NOT NULL) WITHOUT ROWID")
+        self._db.execute("CREATE INDEX IF NOT EXISTS delivered_at_idx ON delivered (delivered_at)")
+        self.writes = 0
+        self.skipped = 0
+        self.compactions = 0
+        self._last_compact = time.monotonic()
+
+    def load_checkpoint(self, slot=0):
+        with self._lock:
+            row = self._db.execute("SELECT created_at, message_id FROM checkpoint WHERE slot = ?", (slot,)).fetchone()
+        if row is None:
+            return None
         try:
-            data = json.loads(raw.decode('utf-8'))
+            return (datetime.fromisoformat(row[0]), row[1])
         except Exception:
-            data = {}
+            return None
+
+    def save_checkpoint(self, key, slot=0):
+        created_at, message_id = key
+        created_iso = created_at.isoformat() if hasattr(created_at, 'isoformat') else str(created_at)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO checkpoint (slot, created_at, message_id, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(slot) DO UPDATE SET created_at = excluded.created_at, message_id = excluded.message_id, updated_at = excluded.updated_at",
+                (slot, created_iso, message_id, time.time())
+            )
+            self.writes += 1
+
+    def is_delivered(self, message_id):
+        with self._lock:
+            found = self._db.execute("SELECT 1 FROM delivered WHERE message_id = ?", (str(message_id),)).fetchone() is not None
+            if found:
+                self.skipped += 1
+            return found
 
-        if self.path == '/send':
-            content = '👋 ' + (data.get('content') or 'Prueba de emergencia')
-            ok = False
+    def mark_delivered(self, message_id):
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO delivered (message_id, delivered_at) VALUES (?, ?)", (str(message_id), time.time()))
+            self.writes += 1
+
+    def compact(self, force=False):
+        if not force and time.monotonic() - self._last_compact < JOURNAL_COMPACT_SECONDS:
+            return False
+        self._last_compact = time.monotonic()
+        with self._lock:
+            self._db.execute("DELETE FROM delivered WHERE delivered_at < ?", (time.time() - self.retention_seconds,))
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.compactions += 1
+        return True
+
+    def close(self):
+        with self._lock:
             try:
-                ok = notify_apns(GLOBAL_APNS_CLIENT, content, DEVICE_TOKENS)
+                self._db.close()
             except Exception:
-                ok = False
-            self.send_response(200 if ok else 500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            resp = {'sent': bool(ok), 'tokens': len(DEVICE_TOKENS)}
-            self.wfile.write(json.dumps(resp).encode('utf-8'))
+                pass
+
+    def stats(self):
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM delivered").fetchone()[0]
+            cp = self._db.execute("SELECT created_at, message_id FROM checkpoint WHERE slot = 0").fetchone()
+        return {
+            'path': self.path,
+            'deliveredIds': size,
+            'checkpoint': {'createdAt': cp[0], 'id': cp[1]} if cp else None,
+            'writes': self.writes,
+            'skippedDuplicates': self.skipped,
+            'compactions': self.compactions
+        }
+
+JOURNAL = None
+INGEST_WATERMARK = IngestWatermark()
+
+def init_journal():
+    if (JOURNAL_PATH or '').lower() == 'off':
+        return None
+    try:
+        return DeliveryJournal(JOURNAL_PATH or os.path.join(DATA_DIR, 'journal.db'), JOURNAL_RETENTION_SECONDS)
+    except Exception as e:
+        print(f"Journal disabled: {e}")
+        return None
+
+def _already_delivered(message_id):
+    if JOURNAL is None or not message_id:
+        return False
+    try:
+        return JOURNAL.is_delivered(message_id)
+    except Exception:
+        return False
+
+def _record_delivered(message_id):
+    if JOURNAL is None or not message_id:
+        return
+    try:
+        JOURNAL.mark_delivered(message_id)
+    except Exception:
+        pass
+
+# Message ids a worker is delivering right now. The API's POST /event and the poller's
+# row for the same message can both be queued before either finishes, so the journal
+# alone is checked too early; whichever job reaches a worker second finds the claim
+# (or, once the first is done, the journal entry) and skips the push.
+DELIVERY_CLAIMS = set()
+DELIVERY_CLAIMS_LOCK = threading.Lock()
+
+def _claim_delivery(job, message_id):
+    if not message_id:
+        return True
+    with DELIVERY_CLAIMS_LOCK:
+        if message_id in DELIVERY_CLAIMS or _already_delivered(message_id):
+            return False
+        DELIVERY_CLAIMS.add(message_id)
+    job['claim'] = message_id
+    return True
+
+def _release_delivery(job):
+    message_id = job.pop('claim', None)
+    if message_id:
+        with DELIVERY_CLAIMS_LOCK:
+            DELIVERY_CLAIMS.discard(message_id)
+
+def channel_partition(channel_id, partitions):
+    return zlib.crc32(str(channel_id).encode('utf-8')) % partitions
+
+def _cursor_order(cursor):
+    # (created_at, None) means "after every row at created_at", so it sorts last.
+    return (cursor[0], cursor[1] is None, cursor[1] or '')
+
+# Cluster mode: channel ids hash into CLUSTER_PARTITIONS partitions, each owned by one
+# instance through a lease row in tify_emitter_leases. Every heartbeat renews the
+# owned leases (writing their checkpoints), counts live instances and claims expired
+# or free partitions up to a fair share, releasing idle extras when others join.
+# Lease times come from each instance's UTC clock, so hosts must be NTP-synced.
+class ClusterCoordinator:
+    def __init__(self, pool, partitions, instance_id, lease_seconds=30, default_checkpoint=None, address=None):
+        self.pool = pool
+        self.partitions = max(1, int(partitions))
+        self.instance_id = instance_id
+        self.address = address
+        self.lease_seconds = max(3, int(lease_seconds))
+        self.default_checkpoint = default_checkpoint or (datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=LOOKBACK_SECONDS), None)
+        self._cursors = {}
+        self._saved = {}
+        self._watermarks = {}
+        # Partitions of the scan run_poller is working through; not released until it ends.
+        self._scanning = set()
+        # Other instances' partitions and addresses, as of the last heartbeat.
+        self._owners = {}
+        self._addresses = {}
+        self._woken = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._renewed_at = 0.0
+        self.live_instances = 0
+        self.claims = 0
+        self.releases = 0
+        self.lost = 0
+        self.heartbeats = 0
+        self.heartbeat_errors = 0
+        self.wakes_forwarded = 0
+        self.wake_errors = 0
+
+    def start(self):
+        try:
+            self.heartbeat()
+        except Exception as e:
+            self.heartbeat_errors += 1
+            print(f"Cluster heartbeat failed: {e}")
+        self._thread = threading.Thread(target=self._run, name='cluster-heartbeat', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3.0):
+            try:
+                self.heartbeat()
+            except Exception:
+                self.heartbeat_errors += 1
+                M_ERRORS.inc(stage='cluster')
+
+    def _checkpoint(self, p):
+        with self._lock:
+            wm = self._watermarks.get(p)
+            return self._cursors[p] if wm is None or wm.idle() else self._saved[p]
+
+    def heartbeat(self):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        expires = now + timedelta(seconds=self.lease_seconds)
+        me = self.instance_id
+        with self._lock:
+            owned = list(self._cursors)
+        lost, claimed, released = [], [], []
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("UPDATE tify_emitter_instances SET heartbeat_at = %s, address = %s WHERE id = %s", (now, self.address, me))
+                if cur.rowcount == 0:
+                    cur.execute("INSERT INTO tify_emitter_instances (id, hostname, address, started_at, heartbeat_at) VALUES (%s, %s, %s, %s, %s)",
+                                (me, socket.gethostname(), self.address, now, now))
+                for p in owned:
+                    cp = self._checkpoint(p)
+                    cur.execute("UPDATE tify_emitter_leases SET expires_at = %s, checkpoint_at = %s, checkpoint_id = %s, updated_at = %s "
+                                "WHERE partition_id = %s AND owner = %s", (expires, cp[0], cp[1], now, p, me))
+                    if cur.rowcount == 0:
+                        lost.append(p)
+                self._renewed_at = time.monotonic()
+                cur.execute("SELECT id, address FROM tify_emitter_instances WHERE heartbeat_at > %s", (now - timedelta(seconds=self.lease_seconds),))
+                instances = cur.fetchall()
+                live = max(1, len(instances))
+                addresses = {r['id']: r['address'] for r in instances if r['address']}
+                cur.execute("SELECT partition_id, owner, expires_at, checkpoint_at, checkpoint_id FROM tify_emitter_leases WHERE partition_id < %s",
+                            (self.partitions,))
+                rows = {r['partition_id']: r for r in cur.fetchall()}
+                for p in range(self.partitions):
+                    if p not in rows:
+                        try:
+                            cur.execute("INSERT INTO tify_emitter_leases (partition_id, updated_at) VALUES (%s, %s)", (p, now))
+                            rows[p] = {'partition_id': p, 'owner': None, 'expires_at': None, 'checkpoint_at': None, 'checkpoint_id': None}
+                        except Exception:
+                            pass
+                target = -(-self.partitions // live)
+                held = len(owned) - len(lost)
+                if held < target:
+                    free = [r for r in rows.values() if r['owner'] != me and (r['owner'] is None or r['expires_at'] is None or r['expires_at'] < now)]
+                    random.shuffle(free)
+                    for r in free[:target - held]:
+                        cur.execute("UPDATE tify_emitter_leases SET owner = %s, expires_at = %s, updated_at = %s "
+                                    "WHERE partition_id = %s AND (owner IS NULL OR expires_at IS NULL OR expires_at < %s)",
+                                    (me, expires, now, r['partition_id'], now))
+                        if cur.rowcount == 1:
+                            cp = (_naive_utc(r['checkpoint_at']), r['checkpoint_id']) if r['checkpoint_at'] is not None else self.default_checkpoint
+                            claimed.append((r['partition_id'], cp))
+                elif held > target:
+                    # Hand back partitions with nothing in flight so the new owner's
+                    # replay from the checkpoint is empty. Partitions of the running scan
+                    # are not idle yet: its rows are still being queued.
+                    with self._lock:
+                        idle = [p for p in owned if p not in lost and p not in self._scanning and self._watermarks[p].idle()]
+                    for p in idle[:held - target]:
+                        with self._lock:
+                            cp = self._cursors.pop(p)
+                            self._saved.pop(p, None)
+                            self._watermarks.pop(p, None)
+                        cur.execute("UPDATE tify_emitter_leases SET owner = NULL, expires_at = NULL, checkpoint_at = %s, checkpoint_id = %s, updated_at = %s "
+                                    "WHERE partition_id = %s AND owner = %s", (cp[0], cp[1], now, p, me))
+                        released.append(p)
+                owners = {p: r['owner'] for p, r in rows.items()
+                          if r['owner'] and r['owner'] != me and r['expires_at'] is not None and r['expires_at'] >= now}
+        with self._lock:
+            self._owners = owners
+            self._addresses = addresses
+            for p in lost:
+                self._cursors.pop(p, None)
+                self._saved.pop(p, None)
+                self._watermarks.pop(p, None)
+            for p, cp in claimed:
+                self._cursors[p] = cp
+                self._saved[p] = cp
+                self._watermarks[p] = IngestWatermark()
+            self.live_instances = live
+            self.heartbeats += 1
+            self.lost += len(lost)
+            self.claims += len(claimed)
+            self.releases += len(released)
+        if lost or claimed or released:
+            print(f"Cluster {me}: claimed={[p for p, _ in claimed]} released={released} lost={lost} owned={sorted(self.owned())}")
+        if claimed:
+            wake_poller()
+
+    def owned(self):
+        with self._lock:
+            return list(self._cursors)
+
+    def partition_of(self, channel_id):
+        return channel_partition(channel_id, self.partitions)
+
+    def owns(self, channel_id):
+        with self._lock:
+            return self.partition_of(channel_id) in self._cursors
+
+    def scan_plan(self):
+        # One keyset scan covers every owned partition: it starts at the oldest
+        # cursor and the poller skips rows at or before their partition's cursor.
+        if time.monotonic() - self._renewed_at > self.lease_seconds:
+            return None
+        with self._lock:
+            if not self._cursors:
+                return None
+            cursors = dict(self._cursors)
+            self._scanning = set(cursors)
+        start = min(cursors.values(), key=_cursor_order)
+        return start, sorted(cursors), cursors
+
+    def end_scan(self):
+        with self._lock:
+            self._scanning = set()
+
+    def track(self, p, key):
+        # False once the partition is no longer ours (lease lost); the caller drops the row.
+        with self._lock:
+            wm = self._watermarks.get(p)
+        if wm is None:
+            return False
+        wm.add(key)
+        return True
+
+    def fail(self, p, key):
+        with self._lock:
+            wm = self._watermarks.get(p)
+        if wm is not None:
+            wm.fail(key)
+
+    def done(self, p, key):
+        with self._lock:
+            wm = self._watermarks.get(p)
+        if wm is None:
             return
+        advanced = wm.done(key)
+        if advanced is not None:
+            with self._lock:
+                if p in self._saved:
+                    self._saved[p] = advanced
+
+    def advance(self, partitions, key):
+        with self._lock:
+            for p in partitions:
+                cur = self._cursors.get(p)
+                if cur is not None and _cursor_order(key) > _cursor_order(cur):
+                    self._cursors[p] = key
+
+    def wake_owner(self, channel_id):
+        # A posted event for a channel another instance polls: ask that instance to poll
+        # now rather than at its next interval. At most one wake per owner every
+        # POLL_MIN_INTERVAL, since it cannot poll any sooner.
+        now = time.monotonic()
+        with self._lock:
+            owner = self._owners.get(self.partition_of(channel_id))
+            address = self._addresses.get(owner)
+            if not address or now - self._woken.get(owner, float('-inf')) < POLL_MIN_INTERVAL:
+                return False
+            self._woken[owner] = now
+        threading.Thread(target=self._post_wake, args=(address,), name='cluster-wake', daemon=True).start()
+        return True
 
-        if self.path == '/event':
+    def _post_wake(self, address):
+        host, _, port = address.rpartition(':')
+        try:
+            conn = HTTPConnection(host, int(port), timeout=2)
             try:
-                base = data.get('content') or ''
-                ev = data.get('eventAt')
-                date_str = _format_event_date(ev) if ev else None
-                content = "👋 " + (base if not date_str else f"{base} · {date_str}")
-                created_iso = data.get('createdAt') or datetime.now(timezone.utc).isoformat()
-                channel_id = data.get('channelId') or 'unknown'
-                evt = {
-                    'id': data.get('id') or f"local_{int(time.time()*1000)}",
-                    'channelId': channel_id,
-                    'content': content,
-                    'createdAt': created_iso,
-                    'eventAt': ev
-                }
-                _upsert_event(evt)
-                try:
-                    tokens = get_recipient_tokens(GLOBAL_DB_CONN, channel_id, created_iso)
-                    if tokens:
-                        notify_apns(GLOBAL_APNS_CLIENT, content, tokens)
-                except Exception:
-                    pass
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'ok': True}).encode('utf-8'))
+                conn.request('POST', '/poll/wake', b'{}', {'Content-Type': 'application/json'})
+                conn.getresponse().read()
+            finally:
+                conn.close()
+            with self._lock:
+                self.wakes_forwarded += 1
+        except Exception:
+            with self._lock:
+                self.wake_errors += 1
+            M_ERRORS.inc(stage='cluster_wake')
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    for p in self.owned():
+                        cp = self._checkpoint(p)
+                        cur.execute("UPDATE tify_emitter_leases SET owner = NULL, expires_at = NULL, checkpoint_at = %s, checkpoint_id = %s, updated_at = %s "
+                                    "WHERE partition_id = %s AND owner = %s", (cp[0], cp[1], now, p, self.instance_id))
+                    cur.execute("DELETE FROM tify_emitter_instances WHERE id = %s", (self.instance_id,))
+        except Exception as e:
+            print(f"Cluster release failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'instance': self.instance_id,
+                'partitions': self.partitions,
+                'owned': sorted(self._cursors),
+                'liveInstances': self.live_instances,
+                'leaseSeconds': self.lease_seconds,
+                'claims': self.claims,
+                'releases': self.releases,
+                'lost': self.lost,
+                'heartbeats': self.heartbeats,
+                'heartbeatErrors': self.heartbeat_errors,
+                'wakesForwarded': self.wakes_forwarded,
+                'wakeErrors': self.wake_errors,
+                'inFlight': sum(len(w) for w in self._watermarks.values())
+            }
+
+CLUSTER = None
+
+# Status of events accepted through POST /event and /events/batch, by tracking id.
+# Bounded: the oldest entries are forgotten first.
+class DeliveryTracker:
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, event_id, channel_id):
+        tracking_id = uuid.uuid4().hex
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            self._items[tracking_id] = {
+                'trackingId': tracking_id,
+                'id': event_id,
+                'channelId': channel_id,
+                'status': 'queued',
+                'acceptedAt': now,
+                'updatedAt': now
+            }
+            while len(self._items) > max(1, self.capacity):
+                self._items.popitem(last=False)
+        return tracking_id
+
+    def update(self, tracking_id, status, **extra):
+        with self._lock:
+            item = self._items.get(tracking_id)
+            if item is None:
                 return
+            item.update(extra)
+            item['status'] = status
+            item['updatedAt'] = datetime.now(timezone.utc).isoformat()
+
+    def discard(self, tracking_id):
+        with self._lock:
+            self._items.pop(tracking_id, None)
+
+    def get(self, tracking_id):
+        with self._lock:
+            item = self._items.get(tracking_id)
+            return dict(item) if item is not None else None
+
+    def __len__(self):
+        return len(self._items)
+
+TRACKER = DeliveryTracker(TRACKING_CAPACITY)
+
+def on_delivery_done(job, ok):
+    # Only pushes that went out (or were already out) are journaled; a failed row holds
+    # the watermark so the checkpoint stays before it and a restart tries it again.
+    settled = ok or job.get('duplicate')
+    tracking_id = job.get('trackingId')
+    if tracking_id:
+        if job.get('duplicate'):
+            TRACKER.update(tracking_id, 'duplicate')
+        elif job.get('deferred'):
+            TRACKER.update(tracking_id, 'deferred')
+            return
+        else:
+            TRACKER.update(tracking_id, 'delivered' if ok else 'failed', recipients=len(job.get('tokens') or ()))
+        if settled:
+            _record_delivered(job.get('messageId'))
+    row = job.get('row')
+    if row is not None and settled:
+        _record_delivered(row['id'])
+    _release_delivery(job)
+    if row is None:
+        return
+    if job.get('partition') is not None:
+        if CLUSTER is not None:
+            if settled:
+                CLUSTER.done(job['partition'], job['key'])
+            else:
+                CLUSTER.fail(job['partition'], job['key'])
+        return
+    if not settled:
+        INGEST_WATERMARK.fail(job['key'])
+        return
+    advanced = INGEST_WATERMARK.done(job['key'])
+    if advanced is not None and JOURNAL is not None:
+        JOURNAL.save_checkpoint(advanced)
+
+def _validate_event(data):
+    if not isinstance(data, dict):
+        raise ValueError('event must be a JSON object')
+    channel_id = data.get('channelId')
+    if not isinstance(channel_id, str) or not channel_id:
+        raise ValueError('channelId is required')
+    if not isinstance(data.get('content'), str):
+        raise ValueError('content is required')
+    for key in ('id', 'createdAt', 'eventAt', 'priority'):
+        if data.get(key) is not None and not isinstance(data.get(key), str):
+            raise ValueError(f'{key} must be a string')
+    if data.get('isEmergency') is not None and not isinstance(data.get('isEmergency'), bool):
+        raise ValueError('isEmergency must be a boolean')
+    if data.get('createdAt') and _parse_created_at(data['createdAt']) is None:
+        raise ValueError('createdAt must be an ISO-8601 timestamp')
+
+def accept_event(data, timeout=ENQUEUE_TIMEOUT, has_row=True):
+    # Validates and records one posted event and queues its delivery. Returns the
+    # tracking id, or None when the delivery queue stays full for `timeout` seconds
+    # (caller answers 503). `has_row`: an event with an id is a message row the
+    # pollers will read too (POST /event from the API); batch items are not.
+    _validate_event(data)
+    if DELIVERY_PIPELINE is None:
+        return None
+    base = data.get('content') or ''
+    ev = data.get('eventAt')
+    date_str = _format_event_date(ev) if ev else None
+    content = "👋 " + (base if not date_str else f"{base} · {date_str}")
+    created_iso = data.get('createdAt') or datetime.now(timezone.utc).isoformat()
+    channel_id = data['channelId']
+    evt = {
+        'id': data.get('id') or f"local_{uuid.uuid4().hex[:12]}",
+        'channelId': channel_id,
+        'content': content,
+        'createdAt': created_iso,
+        'eventAt': ev
+    }
+    tracking_id = TRACKER.create(evt['id'], channel_id)
+    job = {
+        'trackingId': tracking_id,
+        'messageId': data.get('id'),
+        'hasRow': has_row and bool(data.get('id')) and not str(data['id']).startswith('local_'),
+        'channelId': channel_id,
+        'content': content,
+        'tokens': None,
+        'createdAt': _parse_created_at(created_iso),
+        # Posted events are emergencies unless the caller says otherwise.
+        'urgent': data.get('isEmergency', True) is not False or data.get('priority') == 'HIGH'
+    }
+    if not DELIVERY_PIPELINE.submit(job, channel_id, timeout=timeout):
+        TRACKER.discard(tracking_id)
+        return None
+    # Only accepted events reach /events and the streams; after a 503 the caller
+    # retries and nothing of the rejected attempt is left behind.
+    _upsert_event(evt)
+    return tracking_id
+
+def _parse_batch(raw, content_type):
+    text = raw.decode('utf-8')
+    stripped = text.lstrip()
+    if stripped.startswith('[') and 'ndjson' not in (content_type or ''):
+        items = json.loads(stripped)
+        return [(i, item, None) for i, item in enumerate(items)]
+    parsed = []
+    for i, line in enumerate(l for l in text.splitlines() if l.strip()):
+        try:
+            parsed.append((i, json.loads(line), None))
+        except Exception:
+            parsed.append((i, None, 'invalid JSON'))
+    return parsed
+
+def _row_event(row):
+    base = row.get('content') or ''
+    evdt = row.get('event_at')
+    ev_iso = (evdt.isoformat() if evdt and hasattr(evdt, 'isoformat') else (str(evdt) if evdt else None))
+    date_str = _format_event_date(ev_iso) if ev_iso else None
+    content = "👋 " + (base if not date_str else f"{base} · {date_str}")
+    evt = {
+        'id': row['id'],
+        'channelId': row['channel_id'],
+        'content': content,
+        'createdAt': row['created_at'].isoformat() if hasattr(row['created_at'], 'isoformat') else str(row['created_at']),
+        'eventAt': ev_iso
+    }
+    return evt, content
+
+def deliver_message(job):
+    # False when APNs reached no device or the recipients could not be looked up.
+    # Skipped jobs and channels without recipients have nothing left to do and count
+    # as delivered. The webhook only queues here; its failures end up in the sender's
+    # stats and dead-letter spool, not in the job's outcome.
+    ok = True
+    row = job.get('row')
+    if row is not None and WEBHOOK_SENDER is not None:
+        notify_webhook(row)
+    if job.get('trackingId'):
+        # Posted events: the API sends the real message id, so skip it if the
+        # poller (or an earlier post) already delivered it.
+        if job.get('hasRow') and CLUSTER is not None and not CLUSTER.owns(job.get('channelId')):
+            # Another instance owns this channel and delivers it when it polls the row;
+            # wake it so that happens now. Row-less events have nothing to poll and are
+            # delivered here.
+            CLUSTER.wake_owner(job.get('channelId'))
+            job['deferred'] = True
+            return True
+        if not _claim_delivery(job, job.get('messageId')):
+            job['duplicate'] = True
+            return True
+        TRACKER.update(job['trackingId'], 'delivering')
+    elif row is not None and not _claim_delivery(job, row['id']):
+        # Posted by the API and pushed (or being pushed) already; the webhook still gets the row.
+        job['duplicate'] = True
+        return ok
+    tokens = job.get('tokens')
+    lookup_channel = job.get('channelId') or (row or {}).get('channel_id')
+    if tokens is None and lookup_channel:
+        with DB_POOL.connection() as conn:
+            tokens = get_recipient_tokens(conn, lookup_channel, job.get('createdAt'))
+        if tokens is None:
+            return False
+        job['tokens'] = tokens
+    if tokens:
+        if COALESCER is not None and COALESCER.offer(job):
+            return DEFERRED
+        channel_id = job.get('channelId') or (row or {}).get('channel_id')
+        # Only channels that are coalesced get a collapse id: elsewhere each message
+        # must stay on screen instead of replacing the previous one.
+        collapse = not job.get('urgent') and COALESCER is not None and COALESCER.window_for(channel_id) > 0
+        ok = notify_apns(GLOBAL_APNS_CLIENT, job['content'], tokens, channel_id, collapse=collapse)
+    return ok
+
+# Decides how long the poller sleeps: the minimum interval while rows keep arriving,
+# growing by `backoff` per empty cycle up to the maximum. wake() (from /event,
+# /poll/wake or SIGUSR1) cuts the sleep short, but polls stay min_interval apart.
+class PollScheduler:
+    def __init__(self, min_interval, max_interval, backoff=2.0):
+        self.min_interval = max(0.0, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.backoff = max(1.0, backoff)
+        self.delay = self.min_interval
+        self._wake = threading.Event()
+        self._last_poll = 0.0
+        self.polls = 0
+        self.idle_polls = 0
+        self.wakeups = 0
+
+    def record(self, rows):
+        self.polls += 1
+        self._last_poll = time.monotonic()
+        if rows:
+            self.delay = self.min_interval
+        else:
+            self.idle_polls += 1
+            self.delay = min(self.max_interval, max(self.min_interval, self.delay * self.backoff))
+        return self.delay
+
+    def wait(self):
+        woke = self._wake.wait(self.delay)
+        self._wake.clear()
+        if woke:
+            self.wakeups += 1
+            gap = self.min_interval - (time.monotonic() - self._last_poll)
+            if gap > 0:
+                time.sleep(gap)
+        return woke
+
+    def wake(self):
+        self._wake.set()
+
+    def stats(self):
+        return {
+            'minInterval': self.min_interval,
+            'maxInterval': self.max_interval,
+            'nextDelay': round(self.delay, 3),
+            'polls': self.polls,
+            'idlePolls': self.idle_polls,
+            'wakeups': self.wakeups
+        }
+
+POLL_SCHEDULER = None
+
+def wake_poller():
+    if POLL_SCHEDULER is not None:
+        POLL_SCHEDULER.wake()
+
+def collect_stats():
+    stats = {
+        'tracking': {'size': len(TRACKER), 'capacity': TRACKER.capacity},
+        'recentEvents': {'size': len(RECENT_EVENTS), 'capacity': RECENT_EVENTS.capacity, 'cursor': RECENT_EVENTS.cursor()},
+        'stream': EVENT_HUB.stats(),
+        'recipientCache': RECIPIENT_CACHE.stats(),
+        'apnsFeedback': APNS_FEEDBACK.stats()
+    }
+    if DELIVERY_PIPELINE is not None:
+        stats['delivery'] = DELIVERY_PIPELINE.stats()
+    if DB_POOL is not None:
+        stats['dbPool'] = DB_POOL.stats()
+    if WEBHOOK_SENDER is not None:
+        stats['webhook'] = WEBHOOK_SENDER.stats()
+    if JOURNAL is not None:
+        stats['journal'] = JOURNAL.stats()
+        stats['journal']['inFlight'] = len(INGEST_WATERMARK)
+        stats['journal']['failedRows'] = INGEST_WATERMARK.failed
+    if POLL_SCHEDULER is not None:
+        stats['poller'] = POLL_SCHEDULER.stats()
+    if CLUSTER is not None:
+        stats['cluster'] = CLUSTER.stats()
+    if COALESCER is not None:
+        stats['coalescing'] = COALESCER.stats()
+    if isinstance(HTTP_SERVER, AsyncHTTPServer):
+        stats['http'] = HTTP_SERVER.stats()
+    return stats
+
+def _stat(path):
+    # Reads a nested collect_stats()-style value lazily for a gauge.
+    def read():
+        node = {
+            'pipeline': DELIVERY_PIPELINE.stats() if DELIVERY_PIPELINE is not None else None,
+            'pool': DB_POOL.stats() if DB_POOL is not None else None,
+            'cache': RECIPIENT_CACHE.stats(),
+            'stream': EVENT_HUB.stats()
+        }[path[0]]
+        for part in path[1:]:
+            if node is None:
+                return None
+            node = node.get(part)
+        return node
+    return read
+
+METRICS.gauge('emitter_poll_next_delay_seconds', 'Sleep chosen by the adaptive poll scheduler.', lambda: POLL_SCHEDULER.delay if POLL_SCHEDULER is not None else None)
+METRICS.counter_func('emitter_poll_wakeups_total', 'Polls started early by a wake-up signal.', lambda: POLL_SCHEDULER.wakeups if POLL_SCHEDULER is not None else None)
+METRICS.gauge('emitter_cluster_owned_partitions', 'Partitions leased by this instance in cluster mode.', lambda: len(CLUSTER.owned()) if CLUSTER is not None else None)
+METRICS.gauge('emitter_recent_events', 'Events held in the recent-event store.', lambda: len(RECENT_EVENTS))
+METRICS.gauge('emitter_tracked_events', 'Posted events with a tracked delivery status.', lambda: len(TRACKER))
+METRICS.gauge('emitter_delivery_queue_depth', 'Delivery jobs waiting in the pipeline queues.', _stat(('pipeline', 'queueDepth')))
+METRICS.counter_func('emitter_delivery_blocked_seconds_total', 'Total time the poller waited on full delivery queues.', _stat(('pipeline', 'blockedSeconds')))
+METRICS.gauge('emitter_ingest_in_flight', 'Ingested rows whose delivery has not finished.', lambda: len(INGEST_WATERMARK))
+METRICS.counter_func('emitter_recipient_cache_hits_total', 'Recipient cache hits.', _stat(('cache', 'hits')))
+METRICS.counter_func('emitter_recipient_cache_misses_total', 'Recipient cache misses.', _stat(('cache', 'misses')))
+METRICS.gauge('emitter_recipient_cache_handles', 'Handles held in the recipient cache.', _stat(('cache', 'handles')))
+METRICS.gauge('emitter_db_pool_open', 'Open database connections.', _stat(('pool', 'open')))
+METRICS.counter_func('emitter_db_pool_wait_seconds_total', 'Total time spent waiting for a pooled connection.', _stat(('pool', 'waitSeconds')))
+def _stream_subscribers():
+    stats = EVENT_HUB.stats()
+    return {'sse': stats['streams'], 'poll': stats['longPolls']}
+
+METRICS.gauge('emitter_stream_subscribers', 'Connected SSE and long-poll clients.', _stream_subscribers, ('kind',))
+
+# Response of the shared route dispatcher; both HTTP front ends serialize it.
+class HttpResponse:
+    __slots__ = ('status', 'headers', 'body')
+
+    def __init__(self, status, body=b'', headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or []
+
+def _json_response(status, obj, headers=None):
+    return HttpResponse(status, json.dumps(obj).encode('utf-8'), [('Content-Type', 'application/json')] + list((headers or {}).items()))
+
+def _events_response(query, headers):
+    since = (query.get('since') or [None])[0]
+    version, body, packed, etag = RECENT_EVENTS.render()
+    if etag in (headers.get('If-None-Match') or ''):
+        return HttpResponse(304, b'', [('ETag', etag), ('X-Events-Cursor', RECENT_EVENTS.cursor(version))])
+    cursor = RECENT_EVENTS.cursor(version)
+    if since:
+        changed, cursor = RECENT_EVENTS.since(since)
+        if changed is not None:
+            body = json.dumps(changed).encode('utf-8')
+            packed = gzip.compress(body, 6) if len(body) >= GZIP_MIN_BYTES else None
+            etag = f'"{cursor}"'
+    encoded = packed is not None and 'gzip' in (headers.get('Accept-Encoding') or '')
+    out = [('Content-Type', 'application/json'), ('Cache-Control', 'no-cache'), ('ETag', etag),
+           ('X-Events-Cursor', cursor), ('Vary', 'Accept-Encoding')]
+    if encoded:
+        out.append(('Content-Encoding', 'gzip'))
+    return HttpResponse(200, packed if encoded else body, out)
+
+def _batch_response(raw, content_type):
+    try:
+        items = _parse_batch(raw, content_type)
+    except Exception:
+        return _json_response(400, {'ok': False, 'error': 'body must be a JSON array or NDJSON'})
+    if len(items) > BATCH_MAX_EVENTS:
+        return _json_response(413, {'ok': False, 'error': f'at most {BATCH_MAX_EVENTS} events per batch'})
+    results = []
+    accepted = 0
+    full = 0
+    # One ENQUEUE_TIMEOUT for the whole batch: once it is spent, full queues reject
+    # the remaining items at once instead of waiting again per item.
+    deadline = time.monotonic() + ENQUEUE_TIMEOUT
+    for index, item, error in items:
+        if error is None:
+            try:
+                tracking_id = accept_event(item, max(0.0, deadline - time.monotonic()), has_row=False)
+                if tracking_id is None:
+                    error = 'delivery queue full'
+                    full += 1
+            except ValueError as e:
+                error = str(e)
             except Exception:
-                self.send_response(500)
-                self.end_headers()
-                return
+                error = 'internal error'
+        if error is None:
+            accepted += 1
+            results.append({'index': index, 'trackingId': tracking_id})
+        else:
+            results.append({'index': index, 'error': error})
+    if accepted:
+        wake_poller()
+    rejected = len(results) - accepted
+    body = {'ok': accepted > 0, 'accepted': accepted, 'rejected': rejected, 'results': results}
+    if full and full == rejected:
+        # Nothing wrong with the items: the caller should retry the rejected ones later.
+        return _json_response(202 if accepted else 503, body, {'Retry-After': '1'})
+    return _json_response(202 if accepted else 400, body)
 
-        self.send_response(404)
+# Routes that take the socket over (EVENT_HUB); each front end hands them off itself.
+STREAM_ROUTES = ('/events/stream', '/events/poll')
+
+# Routes that may block on the delivery queue, the database or APNs; /stats counts the
+# journal's table under its lock.
+BLOCKING_ROUTES = ('/send', '/event', '/events/batch', '/stats')
+
+def dispatch(method, target, headers, body=b''):
+    # Every route except STREAM_ROUTES. `headers` needs a case-insensitive get().
+    parsed = urlparse(target)
+    route = parsed.path
+    if method == 'GET':
+        if route == '/metrics':
+            return HttpResponse(200, METRICS.render(), [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')])
+        if route.startswith('/events/status/'):
+            item = TRACKER.get(route[len('/events/status/'):])
+            if item is None:
+                return _json_response(404, {'ok': False, 'error': 'unknown tracking id'})
+            return _json_response(200, item)
+        if route == '/health':
+            return HttpResponse(200, b'{"status":"ok"}', [('Content-Type', 'application/json')])
+        if route == '/events':
+            try:
+                return _events_response(parse_qs(parsed.query), headers)
+            except Exception:
+                return HttpResponse(500)
+        if route == '/stats':
+            return HttpResponse(200, json.dumps(collect_stats()).encode('utf-8'), [('Content-Type', 'application/json'), ('Cache-Control', 'no-cache')])
+        return HttpResponse(404)
+    if method != 'POST':
+        return HttpResponse(501)
+    if route == '/events/batch':
+        return _batch_response(body, headers.get('Content-Type'))
+    try:
+        data = json.loads((body or b'{}').decode('utf-8'))
+    except Exception:
+        data = {}
+
+    if route == '/send':
+        content = '👋 ' + ((data.get('content') if isinstance(data, dict) else None) or 'Prueba de emergencia')
+        results = {}
+        try:
+            results = fanout_apns(GLOBAL_APNS_CLIENT, content, DEVICE_TOKENS)
+        except Exception:
+            results = {}
+        ok = bool(results) and all(r == 'Success' for r in results.values())
+        return _json_response(200 if ok else 500, {'sent': bool(ok), 'tokens': len(DEVICE_TOKENS), 'results': summarize_apns(results)})
+
+    if route == '/event':
+        if not isinstance(data, dict) or not data:
+            return _json_response(400, {'ok': False, 'error': 'invalid JSON body'})
+        try:
+            tracking_id = accept_event(data)
+        except ValueError as e:
+            return _json_response(400, {'ok': False, 'error': str(e)})
+        except Exception:
+            M_ERRORS.inc(stage='http_event')
+            return HttpResponse(500)
+        wake_poller()
+        if tracking_id is None:
+            return _json_response(503, {'ok': False, 'error': 'delivery queue full'}, {'Retry-After': '1'})
+        return _json_response(202, {'ok': True, 'trackingId': tracking_id, 'status': f'/events/status/{tracking_id}'})
+
+    if route == '/poll/wake':
+        wake_poller()
+        return _json_response(202, {'ok': True})
+
+    if route == '/cache/invalidate':
+        if not isinstance(data, dict):
+            data = {}
+        channel_id = data.get('channelId') or None
+        channel_ids = data.get('channelIds')
+        handle = data.get('handle')
+        if isinstance(handle, str) and handle:
+            APNS_FEEDBACK.revive([handle])
+        if isinstance(channel_ids, list):
+            # A user's handle changed: only the channels they receive are stale.
+            for cid in set(c for c in channel_ids if isinstance(c, str) and c):
+                RECIPIENT_CACHE.invalidate(cid)
+        elif channel_id is not None or not handle:
+            RECIPIENT_CACHE.invalidate(channel_id)
+        return _json_response(200, {'ok': True, 'channelId': channel_id})
+
+    return HttpResponse(404)
+
+class Handler(BaseHTTPRequestHandler):
+    def _respond(self, resp):
+        self.send_response(resp.status)
+        for k, v in resp.headers:
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(resp.body)))
         self.end_headers()
+        if resp.body:
+            self.wfile.write(resp.body)
+
+    def _detach_to_hub(self):
+        detach = getattr(self.server, 'detach', None)
+        EVENT_HUB.start()
+        if detach is None or EVENT_HUB.full():
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return False
+        detach(self.request)
+        self.close_connection = True
+        return True
+
+    def _open_stream(self):
+        query = parse_qs(urlparse(self.path).query)
+        last_id = self.headers.get('Last-Event-ID') or (query.get('lastEventId') or [None])[0]
+        if not self._detach_to_hub():
+            return
+        self.wfile.write(SSE_HEADERS)
+        self.wfile.flush()
+        EVENT_HUB.subscribe_stream(self.request, last_id)
+
+    def _open_long_poll(self):
+        since, timeout = _long_poll_args(parse_qs(urlparse(self.path).query))
+        if not self._detach_to_hub():
+            return
+        EVENT_HUB.subscribe_poll(self.request, since, timeout)
+
+    def do_GET(self):
+        route = urlparse(self.path).path
+        if route == '/events/stream':
+            self._open_stream()
+            return
+        if route == '/events/poll':
+            self._open_long_poll()
+            return
+        self._respond(dispatch('GET', self.path, self.headers))
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', '0'))
+        except Exception:
+            length = 0
+        if length > MAX_BODY_BYTES:
+            self._respond(_json_response(413, {'ok': False, 'error': 'body too large'}))
+            self.close_connection = True
+            return
+        raw = self.rfile.read(length) if length > 0 else b''
+        self._respond(dispatch('POST', self.path, self.headers, raw))
+
+SSE_HEADERS = (b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+               b'Connection: keep-alive\r\nX-Accel-Buffering: no\r\n\r\n')
+
+def _long_poll_args(query):
+    since = (query.get('since') or [None])[0]
+    try:
+        timeout = min(max(float((query.get('timeout') or [LONG_POLL_TIMEOUT])[0]), 0.0), 120.0)
+    except Exception:
+        timeout = LONG_POLL_TIMEOUT
+    return since, timeout
+
+# Sockets handed to EVENT_HUB must outlive the request thread that accepted them.
+class EmitterHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, *args, **kwargs):
+        self._detached = set()
+        self._detached_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def detach(self, request):
+        with self._detached_lock:
+            self._detached.add(request)
+
+    def shutdown_request(self, request):
+        with self._detached_lock:
+            if request in self._detached:
+                self._detached.discard(request)
+                return
+        super().shutdown_request(request)
+
+def _encode_response(resp, keep_alive, http10=False):
+    try:
+        phrase = HTTPStatus(resp.status).phrase
+    except ValueError:
+        phrase = ''
+    lines = [f'HTTP/1.1 {resp.status} {phrase}', f'Date: {_http_date()}']
+    lines.extend(f'{k}: {v}' for k, v in resp.headers)
+    lines.append(f'Content-Length: {len(resp.body)}')
+    if not keep_alive:
+        lines.append('Connection: close')
+    elif http10:
+        lines.append('Connection: keep-alive')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + resp.body
+
+_DATE_CACHE = [0, '']
+
+def _http_date():
+    now = int(time.time())
+    if _DATE_CACHE[0] != now:
+        _DATE_CACHE[:] = [now, formatdate(now, usegmt=True)]
+    return _DATE_CACHE[1]
+
+# Opt-in front end (EMITTER_HTTP_MODE=asyncio): a single event loop thread owns every
+# connection, keeps it alive between requests and answers pipelined requests in order.
+# Routes that can block (BLOCKING_ROUTES) run on a bounded executor; a semaphore of the
+# same size keeps further requests waiting in the loop instead of the executor queue.
+# Streams and long-polls leave the loop: the socket is duplicated and given to EVENT_HUB.
+class AsyncHTTPServer:
+    MAX_HEADER_BYTES = 64 * 1024
+    WRITE_HIGH_WATER = 64 * 1024
+
+    def __init__(self, address, workers=None, keepalive=None):
+        self.server_address = address
+        self.workers = max(1, workers or HTTP_WORKERS)
+        self.keepalive = HTTP_KEEPALIVE_SECONDS if keepalive is None else keepalive
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='http')
+        self._loop = None
+        self._server = None
+        self._slots = None
+        self._writers = set()
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = None
+        self._counts = {'connections': 0, 'requests': 0, 'detached': 0, 'offloaded': 0}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='http-asyncio', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def shutdown(self):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._close_all)
+        self._thread.join(5)
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        return dict(self._counts, mode='asyncio', open=len(self._writers), workers=self.workers)
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        try:
+            self._slots = asyncio.Semaphore(self.workers)
+            host, port = self.server_address
+            self._server = loop.run_until_complete(asyncio.start_server(
+                self._serve, host, port, backlog=1024, limit=self.MAX_HEADER_BYTES, reuse_address=True))
+            self.server_address = self._server.sockets[0].getsockname()[:2]
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            loop.close()
+            return
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def _close_all(self):
+        self._server.close()
+        for writer in list(self._writers):
+            writer.transport.abort()
+        self._loop.stop()
+
+    async def _serve(self, reader, writer):
+        self._counts['connections'] += 1
+        self._writers.add(writer)
+        keep = True
+        try:
+            while keep:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.keepalive)
+                except asyncio.LimitOverrunError:
+                    writer.write(_encode_response(HttpResponse(431), False))
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                keep = await self._handle(head, reader, writer)
+                if keep is None:
+                    return
+                if writer.transport.get_write_buffer_size() > self.WRITE_HIGH_WATER:
+                    await writer.drain()
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            self._writers.discard(writer)
+            if keep is not None:
+                writer.close()
+
+    async def _handle(self, head, reader, writer):
+        # True keeps the connection, False closes it after the response, None: detached.
+        self._counts['requests'] += 1
+        end = head.find(b'\r\n')
+        try:
+            method, target, version = head[:end].decode('latin-1').split(' ', 2)
+            headers = parse_headers(io.BytesIO(head[end + 2:]))
+        except Exception:
+            writer.write(_encode_response(HttpResponse(400), False))
+            return False
+        connection = (headers.get('Connection') or '').lower()
+        http10 = version == 'HTTP/1.0'
+        keep = ('keep-alive' in connection) if http10 else ('close' not in connection)
+        if headers.get('Transfer-Encoding'):
+            writer.write(_encode_response(HttpResponse(411), False))
+            return False
+        try:
+            length = int(headers.get('Content-Length') or 0)
+        except ValueError:
+            writer.write(_encode_response(HttpResponse(400), False))
+            return False
+        if length > MAX_BODY_BYTES:
+            writer.write(_encode_response(_json_response(413, {'ok': False, 'error': 'body too large'}), False))
+            return False
+        body = await asyncio.wait_for(reader.readexactly(length), self.keepalive) if length > 0 else b''
+
+        route = urlparse(target).path
+        if method == 'GET' and route in STREAM_ROUTES:
+            return await self._detach(route, target, headers, writer)
+        try:
+            if route in BLOCKING_ROUTES:
+                self._counts['offloaded'] += 1
+                async with self._slots:
+                    resp = await self._loop.run_in_executor(self._executor, dispatch, method, target, headers, body)
+            else:
+                resp = dispatch(method, target, headers, body)
+        except Exception:
+            M_ERRORS.inc(stage='http')
+            resp = HttpResponse(500)
+        writer.write(_encode_response(resp, keep, http10))
+        return keep
+
+    async def _detach(self, route, target, headers, writer):
+        EVENT_HUB.start()
+        if EVENT_HUB.full():
+            writer.write(_encode_response(HttpResponse(503), False))
+            return False
+        query = parse_qs(urlparse(target).query)
+        transport = writer.transport
+        transport.pause_reading()
+        # Earlier pipelined responses must reach the socket before it changes hands.
+        transport.set_write_buffer_limits(0)
+        await writer.drain()
+        raw = transport.get_extra_info('socket')
+        sock = socket.fromfd(raw.fileno(), raw.family, raw.type)
+        transport.abort()
+        self._counts['detached'] += 1
+        if route == '/events/stream':
+            last_id = headers.get('Last-Event-ID') or (query.get('lastEventId') or [None])[0]
+            try:
+                sock.setblocking(True)
+                sock.sendall(SSE_HEADERS)
+            except OSError:
+                sock.close()
+                return None
+            EVENT_HUB.subscribe_stream(sock, last_id)
+        else:
+            since, timeout = _long_poll_args(query)
+            EVENT_HUB.subscribe_poll(sock, since, timeout)
+        return None
+
+HTTP_SERVER = None
+
+def serve_http(host, port, mode=None):
+    # Starts the HTTP front end selected by `mode` (EMITTER_HTTP_MODE) in the background.
+    mode = mode or HTTP_MODE
+    if mode == 'asyncio':
+        return AsyncHTTPServer((host, port)).start()
+    if mode != 'threading':
+        print(f"Unknown EMITTER_HTTP_MODE={mode}, using threading")
+    srv = EmitterHTTPServer((host, port), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
 
 def start_http_server():
-    print(f"Initializing HTTP server")
+    global HTTP_SERVER
+    print(f"Initializing HTTP server mode={HTTP_MODE}")
+    EVENT_HUB.start()
     try:
-        srv = ThreadingHTTPServer((BIND_HOST, HTTP_PORT), Handler)
-        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        HTTP_SERVER = serve_http(BIND_HOST, HTTP_PORT)
         print(f"Emitter HTTP listening {BIND_HOST}:{HTTP_PORT}")
         base_local = f"http://localhost:{HTTP_PORT}"
         base_ip = (f"http://{BIND_HOST}:{HTTP_PORT}" if BIND_HOST and BIND_HOST != '0.0.0.0' else None)
         print("Available endpoints:")
         print(f"  GET  {base_local}/health" + (f"    |    {base_ip}/health" if base_ip else ""))
-        print(f"  GET  {base_local}/events" + (f"    |    {base_ip}/events" if base_ip else ""))
+        print(f"  GET  {base_local}/events[?since=cursor]" + (f"    |    {base_ip}/events" if base_ip else ""))
+        print(f"  GET  {base_local}/events/stream" + (f"    |    {base_ip}/events/stream" if base_ip else ""))
+        print(f"  GET  {base_local}/events/poll[?since=cursor]" + (f"    |    {base_ip}/events/poll" if base_ip else ""))
         print(f"  POST {base_local}/event" + (f"    |    {base_ip}/event" if base_ip else ""))
+        print(f"  POST {base_local}/events/batch" + (f"    |    {base_ip}/events/batch" if base_ip else ""))
+        print(f"  GET  {base_local}/events/status/<trackingId>" + (f"    |    {base_ip}/events/status/<trackingId>" if base_ip else ""))
         print(f"  POST {base_local}/send" + (f"    |    {base_ip}/send" if base_ip else ""))
+        print(f"  GET  {base_local}/stats" + (f"    |    {base_ip}/stats" if base_ip else ""))
+        print(f"  GET  {base_local}/metrics" + (f"    |    {base_ip}/metrics" if base_ip else ""))
+        print(f"  POST {base_local}/cache/invalidate" + (f"    |    {base_ip}/cache/invalidate" if base_ip else ""))
+        print(f"  POST {base_local}/poll/wake" + (f"    |    {base_ip}/poll/wake" if base_ip else ""))
     except Exception as e:
         print(f"Failed initializing HTTP server: {e}")
         try:
             fallback = '0.0.0.0'
-            srv = ThreadingHTTPServer((fallback, HTTP_PORT), Handler)
-            threading.Thread(target=srv.serve_forever, daemon=True).start()
+            HTTP_SERVER = serve_http(fallback, HTTP_PORT)
             print(f"Emitter HTTP listening {fallback}:{HTTP_PORT}")
             base_local = f"http://localhost:{HTTP_PORT}"
             print("Available endpoints:")
             print(f"  GET  {base_local}/health")
             print(f"  GET  {base_local}/events")
+            print(f"  GET  {base_local}/events/stream")
+            print(f"  GET  {base_local}/events/poll")
             print(f"  POST {base_local}/event")
+            print(f"  POST {base_local}/events/batch")
+            print(f"  GET  {base_local}/events/status/<trackingId>")
             print(f"  POST {base_local}/send")
+            print(f"  GET  {base_local}/stats")
+            print(f"  GET  {base_local}/metrics")
+            print(f"  POST {base_local}/cache/invalidate")
+            print(f"  POST {base_local}/poll/wake")
         except Exception as e2:
             print(f"Fallback failed: {e2}")
             pass
 
+# The ingest loop: reads new rows from `checkpoint` on, publishes them and queues their
+# delivery, then sleeps as the scheduler decides. Runs until `stop` is set or Ctrl-C.
+# With a cluster coordinator only the owned partitions are read, from their own cursors.
+def run_poller(pipeline, checkpoint, scheduler, stop=None, cluster=None):
+    while stop is None or not stop.is_set():
+        try:
+            cycle_start = time.perf_counter()
+            cycle_rows = 0
+            since, partitions, cursors = checkpoint, None, None
+            if cluster is not None:
+                plan = cluster.scan_plan()
+                if plan is None:
+                    scheduler.record(0)
+                    scheduler.wait()
+                    continue
+                since, partitions, cursors = plan
+            last = None
+            with DB_POOL.connection() as conn:
+                for rows in iter_message_pages(conn, since, FETCH_PAGE_SIZE, partitions, cluster.partitions if cluster is not None else None):
+                    last = (rows[-1]['created_at'], rows[-1]['id'])
+                    if cursors is not None:
+                        rows = [r for r in rows if _cursor_order((r['created_at'], r['id'])) > _cursor_order(cursors[cluster.partition_of(r['channel_id'])])]
+                        if not rows:
+                            continue
+                    cycle_rows += len(rows)
+                    try:
+                        recipients = resolve_recipients(conn, [row['channel_id'] for row in rows])
+                    except Exception:
+                        # The workers look each channel up again; an empty list here would
+                        # deliver the page to nobody and journal it as done.
+                        M_ERRORS.inc(stage='recipients')
+                        recipients = None
+                    now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
+                    for row in rows:
+                        key = (row['created_at'], row['id'])
+                        created = _naive_utc(row['created_at'])
+                        if isinstance(created, datetime):
+                            M_INGEST_LAG.observe(max(0.0, (now_utc - created).total_seconds()))
+                        content = None
+                        try:
+                            evt, content = _row_event(row)
+                            _upsert_event(evt)
+                        except Exception:
+                            M_ERRORS.inc(stage='ingest')
+                        if content is not None and not _already_delivered(row['id']):
+                            tokens = None if recipients is None else _filter_recipients(recipients.get(row['channel_id'], ()), _parse_created_at(row['created_at']))
+                            job = {'row': row, 'key': key, 'content': content, 'tokens': tokens, 'createdAt': row['created_at'],
+                                   'urgent': bool(row.get('is_emergency')) or row.get('priority') == 'HIGH'}
+                            if cluster is not None:
+                                job['partition'] = cluster.partition_of(row['channel_id'])
+                                if not cluster.track(job['partition'], key):
+                                    # Lease lost mid-scan: the new owner replays the row.
+                                    continue
+                            else:
+                                INGEST_WATERMARK.add(key)
+                            pipeline.submit(job, row['channel_id'])
+                        elif cluster is None and JOURNAL is not None and INGEST_WATERMARK.idle():
+                            JOURNAL.save_checkpoint(key)
+                        checkpoint = key
+                try:
+                    APNS_FEEDBACK.flush(conn)
+                except Exception:
+                    M_ERRORS.inc(stage='apns_prune')
+            if cluster is not None:
+                if last is not None:
+                    cluster.advance(partitions, last)
+                cluster.end_scan()
+            M_POLL_CYCLE.observe(time.perf_counter() - cycle_start)
+            M_POLL_ROWS.observe(cycle_rows)
+            scheduler.record(cycle_rows)
+            if JOURNAL is not None:
+                JOURNAL.compact()
+            scheduler.wait()
+        except KeyboardInterrupt:
+            break
+        except Exception:
+            M_ERRORS.inc(stage='poll')
+            if cluster is not None:
+                cluster.end_scan()
+            try:
+                scheduler.record(0)
+                scheduler.wait()
+            except KeyboardInterrupt:
+                break
+    return checkpoint
+
 def main():
     try:
         print(f"Emitter running host={socket.gethostname()} cwd={os.getcwd()} pid={os.getpid()}")
         print(f"DB target host={DB_HOST} db={DB_NAME} port={DB_PORT} interval={POLL_INTERVAL}s lookback={LOOKBACK_SECONDS}s")
+        print(f"APNs fan-out concurrency={APNS_CONCURRENCY} batch={APNS_BATCH_SIZE} delivery workers={DELIVERY_WORKERS} queue={DELIVERY_QUEUE_SIZE}")
     except Exception:
         pass
     _load_backend_env()
     start_http_server()
-    conn = connect_db()
     apns_client = init_apns()
-    global GLOBAL_APNS_CLIENT, GLOBAL_DB_CONN
+    global GLOBAL_APNS_CLIENT, DB_POOL, DELIVERY_PIPELINE, WEBHOOK_SENDER, JOURNAL
     GLOBAL_APNS_CLIENT = apns_client
-    GLOBAL_DB_CONN = conn
+    WEBHOOK_SENDER = init_webhook()
+    JOURNAL = init_journal()
+    DB_POOL = DbPool(connect_db, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_PING_AFTER)
+    pipeline = DeliveryPipeline(deliver_message, DELIVERY_WORKERS, DELIVERY_QUEUE_SIZE, on_delivery_done)
+    pipeline.start()
+    DELIVERY_PIPELINE = pipeline
+    global COALESCER
+    COALESCER = init_coalescer()
     try:
-        tokens = load_device_tokens(conn)
+        with DB_POOL.connection() as conn:
+            tokens = load_device_tokens(conn)
         if tokens:
             global DEVICE_TOKENS
             DEVICE_TOKENS = tokens
     except Exception:
         pass
-    last_checked = datetime.now(timezone.utc) - timedelta(seconds=LOOKBACK_SECONDS)
-    while True:
+    # Keyset checkpoint (created_at, id): rows sharing a timestamp are neither skipped nor re-read.
+    # The lookback only applies on the very first start; afterwards the journal has the resume point.
+    checkpoint = JOURNAL.load_checkpoint() if JOURNAL is not None else None
+    if checkpoint is None:
+        checkpoint = (datetime.now(timezone.utc) - timedelta(seconds=LOOKBACK_SECONDS), None)
+    print(f"Resuming from created_at={checkpoint[0]} id={checkpoint[1]}")
+    global POLL_SCHEDULER
+    scheduler = PollScheduler(POLL_MIN_INTERVAL, POLL_INTERVAL if POLL_MAX_INTERVAL is None else POLL_MAX_INTERVAL, POLL_BACKOFF)
+    POLL_SCHEDULER = scheduler
+    if hasattr(signal, 'SIGUSR1'):
         try:
-            rows = fetch_messages_since(conn, last_checked)
-            if rows:
-                latest = last_checked
-                for row in rows:
-                    try:
-                        base = row.get('content') or ''
-                        evdt = row.get('event_at')
-                        ev_iso = (evdt.isoformat() if evdt and hasattr(evdt, 'isoformat') else (str(evdt) if evdt else None))
-                        date_str = _format_event_date(ev_iso) if ev_iso else None
-                        content = "👋 " + (base if not date_str else f"{base} · {date_str}")
-                        evt = {
-                            'id': row['id'],
-                            'channelId': row['channel_id'],
-                            'content': content,
-                            'createdAt': row['created_at'].isoformat() if hasattr(row['created_at'], 'isoformat') else str(row['created_at']),
-                            'eventAt': ev_iso
-                        }
-                        _upsert_event(evt)
-                    except Exception:
-                        pass
-                    sent = False
-                    if WEBHOOK_URL:
-                        sent = notify_webhook(row)
-                    try:
-                        tokens = get_recipient_tokens(conn, row['channel_id'], row['created_at'].isoformat() if hasattr(row['created_at'], 'isoformat') else str(row['created_at']))
-                        if tokens:
-                            notify_apns(apns_client, content, tokens)
-                            sent = True
-                    except Exception:
-                        pass
-                    cdt = row['created_at']
-                    if isinstance(cdt, datetime) and cdt.tzinfo is None:
-                        cdt = cdt.replace(tzinfo=timezone.utc)
-                    if isinstance(cdt, datetime) and cdt > latest:
-                        latest = cdt
-                last_checked = latest
-            time.sleep(POLL_INTERVAL)
-        except KeyboardInterrupt:
-            break
+            signal.signal(signal.SIGUSR1, lambda signum, frame: scheduler.wake())
         except Exception:
-            time.sleep(POLL_INTERVAL)
-    try:
-        conn.close()
-    except Exception:
-        pass
+            pass
+    print(f"Poll interval adaptive min={scheduler.min_interval}s max={scheduler.max_interval}s backoff={scheduler.backoff}")
+    global CLUSTER
+    if CLUSTER_PARTITIONS > 0:
+        instance_id = CLUSTER_INSTANCE_ID or f"{socket.gethostname()}-{os.getpid()}"
+        address = CLUSTER_ADDRESS or f"{BIND_HOST if BIND_HOST and BIND_HOST != '0.0.0.0' else socket.gethostname()}:{HTTP_PORT}"
+        CLUSTER = ClusterCoordinator(DB_POOL, CLUSTER_PARTITIONS, instance_id, CLUSTER_LEASE_SECONDS, (_naive_utc(checkpoint[0]), checkpoint[1]), address)
+        print(f"Cluster mode instance={instance_id} address={address} partitions={CLUSTER_PARTITIONS} lease={CLUSTER_LEASE_SECONDS}s")
+        CLUSTER.start()
+    run_poller(pipeline, checkpoint, scheduler, cluster=CLUSTER)
+    pipeline.stop()
+    if COALESCER is not None:
+        COALESCER.close()
+    if CLUSTER is not None:
+        CLUSTER.stop()
+    if WEBHOOK_SENDER is not None:
+        WEBHOOK_SENDER.close()
+    if JOURNAL is not None:
+        JOURNAL.close()
+    DB_POOL.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
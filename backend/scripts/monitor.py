@@ -1,58 +1,359 @@
 #!/usr/bin/env python3
 """
 Monitor de peticiones de red en tiempo real
-Muestra una gráfica en terminal del tráfico saliente del puerto 3333
+Muestra una gráfica en terminal de las conexiones de uno o varios puertos (3333 por defecto)
+También graba muestras en un archivo circular, las reproduce y las exporta a CSV/JSON
 """
 
-import psutil
+import argparse
+import csv
+import json
+import mmap
+import select
+import struct
 import time
 from collections import deque
+from datetime import datetime
 import os
 import sys
 
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import termios
+    import tty
+except ImportError:
+    termios = None
+    tty = None
+
+# Estados TCP tal como aparecen (en hexadecimal) en /proc/net/tcp
+TCP_STATES = {
+    '01': 'ESTABLISHED',
+    '02': 'SYN_SENT',
+    '03': 'SYN_RECV',
+    '04': 'FIN_WAIT1',
+    '05': 'FIN_WAIT2',
+    '06': 'TIME_WAIT',
+    '07': 'CLOSE',
+    '08': 'CLOSE_WAIT',
+    '09': 'LAST_ACK',
+    '0A': 'LISTEN',
+    '0B': 'CLOSING',
+}
+
+PROC_NET_FILES = ('/proc/net/tcp', '/proc/net/tcp6')
+
+
+class ProcNetSampler:
+    """Cuenta conexiones por puerto local y estado leyendo /proc/net/tcp{,6} (sin root)"""
+
+    def __init__(self, ports):
+        self.ports = list(ports)
+        # Puerto local en hexadecimal, tal como termina el campo local_address
+        self._wanted = {f'{p:04X}'.encode(): p for p in self.ports}
+        self._states = {k.encode(): v for k, v in TCP_STATES.items()}
+        self._files = []
+        for path in PROC_NET_FILES:
+            try:
+                self._files.append(open(path, 'rb'))
+            except OSError:
+                pass
+
+    @staticmethod
+    def available():
+        return os.path.exists(PROC_NET_FILES[0])
+
+    def sample(self):
+        """Devuelve {puerto: {estado: cantidad}}"""
+        counts = {p: {} for p in self.ports}
+        wanted = self._wanted
+        states = self._states
+        for f in self._files:
+            f.seek(0)
+            f.readline()  # cabecera
+            for line in f:
+                # "  sl  local_address rem_address   st ..." -> local termina en :PPPP
+                fields = line.split(None, 4)
+                if len(fields) < 4:
+                    continue
+                port = wanted.get(fields[1][-4:])
+                if port is None:
+                    continue
+                state = states.get(fields[3], 'UNKNOWN')
+                per_port = counts[port]
+                per_port[state] = per_port.get(state, 0) + 1
+        return counts
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        self._files = []
+
+
+class PsutilSampler:
+    """Alternativa para sistemas sin /proc (macOS); requiere psutil y a veces root"""
+
+    def __init__(self, ports):
+        if psutil is None:
+            raise RuntimeError("psutil no está instalado (pip install psutil)")
+        self.ports = list(ports)
+
+    def sample(self):
+        counts = {p: {} for p in self.ports}
+        try:
+            connections = psutil.net_connections(kind='tcp')
+        except (psutil.AccessDenied, PermissionError):
+            print("\n⚠️  Se requieren permisos de administrador/root")
+            print("Ejecuta con: sudo python3 monitor.py")
+            sys.exit(1)
+        for conn in connections:
+            # Verifica si la conexión local es desde uno de nuestros puertos
+            if conn.laddr and conn.laddr.port in counts:
+                per_port = counts[conn.laddr.port]
+                per_port[conn.status] = per_port.get(conn.status, 0) + 1
+        return counts
+
+    def close(self):
+        pass
+
+
+def make_sampler(ports):
+    if ProcNetSampler.available():
+        return ProcNetSampler(ports)
+    return PsutilSampler(ports)
+
+
+# Archivo circular de muestras: cabecera de 64 bytes y registros de ancho fijo
+# (marca de tiempo float64 + un uint16 por puerto con las conexiones del estado vigilado).
+# Un puerto a 1 muestra/s ocupa 10 bytes por muestra: tres días caben en ~2.6 MB.
+RING_MAGIC = b'TIFYMON1'
+RING_HEADER = struct.Struct('<8sHHIQd16s8H')
+RING_MAX_PORTS = 8
+
+
+class RingFile:
+    """Serie temporal en un archivo circular mapeado en memoria"""
+
+    def __init__(self, path, ports=None, state='ESTABLISHED', interval=1.0, capacity=259200):
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) >= RING_HEADER.size
+        if not exists and ports is None:
+            raise FileNotFoundError(f"No existe el archivo de grabación: {path}")
+        if exists:
+            with open(path, 'rb') as f:
+                header = RING_HEADER.unpack(f.read(RING_HEADER.size))
+            if header[0] != RING_MAGIC:
+                raise ValueError(f"{path} no es un archivo de grabación del monitor")
+            _, _, n_ports, self.capacity, _, self.interval, raw_state, *raw_ports = header
+            self.ports = list(raw_ports[:n_ports])
+            self.state = raw_state.rstrip(b'\0').decode()
+            if ports is not None and list(ports) != self.ports:
+                raise ValueError(f"{path} graba los puertos {self.ports}, no {list(ports)}")
+            if ports is not None and state != self.state:
+                raise ValueError(f"{path} graba el estado {self.state}, no {state}")
+            if ports is not None and float(interval) != self.interval:
+                raise ValueError(f"{path} graba cada {self.interval:g}s, no cada {float(interval):g}s")
+        else:
+            if not 0 < len(ports) <= RING_MAX_PORTS:
+                raise ValueError(f"Se pueden grabar entre 1 y {RING_MAX_PORTS} puertos")
+            self.ports = list(ports)
+            self.state = state
+            self.interval = float(interval)
+            self.capacity = int(capacity)
+        self.record = struct.Struct(f'<d{len(self.ports)}H')
+        size = RING_HEADER.size + self.record.size * self.capacity
+        mode = 'r+b' if exists else 'w+b'
+        self._file = open(path, mode)
+        if not exists:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        if not exists:
+            self._write_header(0)
+        self.written = struct.unpack_from('<Q', self._map, 16)[0]
+
+    def _write_header(self, written):
+        ports = self.ports + [0] * (RING_MAX_PORTS - len(self.ports))
+        RING_HEADER.pack_into(self._map, 0, RING_MAGIC, 1, len(self.ports), self.capacity, written,
+                              self.interval, self.state.encode()[:16], *ports)
+
+    def append(self, ts, counts):
+        offset = RING_HEADER.size + (self.written % self.capacity) * self.record.size
+        self.record.pack_into(self._map, offset, ts, *(min(int(c), 65535) for c in counts))
+        self.written += 1
+        struct.pack_into('<Q', self._map, 16, self.written)
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def read(self):
+        """Devuelve (tiempos, conteos por puerto) en orden cronológico"""
+        n = len(self)
+        start = self.written % self.capacity if self.written > self.capacity else 0
+        if np is not None:
+            dtype = np.dtype([('t', '<f8'), ('c', '<u2', (len(self.ports),))])
+            rows = np.frombuffer(self._map, dtype=dtype, count=self.capacity, offset=RING_HEADER.size)[:n]
+            rows = np.concatenate([rows[start:], rows[:start]]) if start else rows.copy()
+            return rows['t'], rows['c'].astype(np.int64)
+        body = memoryview(self._map)[RING_HEADER.size:RING_HEADER.size + n * self.record.size]
+        rows = list(self.record.iter_unpack(body))
+        body.release()
+        rows = rows[start:] + rows[:start]
+        return [r[0] for r in rows], [list(r[1:]) for r in rows]
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+
+def _percentile_sorted(values, pct):
+    idx = min(len(values) - 1, max(0, int(round(pct / 100.0 * (len(values) - 1)))))
+    return values[idx]
+
+
+def rollup(times, counts, window, percentiles=(50, 90, 99)):
+    """Resumen por ventana de `window` segundos del total de conexiones de todos los puertos"""
+    if len(times) == 0:
+        return []
+    if np is not None:
+        t = np.asarray(times)
+        total = np.asarray(counts).sum(axis=1)
+        bucket = np.floor((t - t[0]) / window).astype(np.int64)
+        # Las muestras están en orden cronológico: cada ventana es un tramo contiguo
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        sizes = np.diff(np.r_[starts, len(total)])
+        mins = np.minimum.reduceat(total, starts)
+        maxs = np.maximum.reduceat(total, starts)
+        avgs = np.add.reduceat(total, starts) / sizes
+        ordered = np.lexsort((total, bucket))
+        sorted_total = total[ordered]
+        pcts = {p: sorted_total[starts + np.rint(p / 100.0 * (sizes - 1)).astype(np.int64)] for p in percentiles}
+        rows = []
+        for i, start in enumerate(starts.tolist()):
+            row = {'inicio': float(t[start]), 'fin': float(t[start + sizes[i] - 1]), 'muestras': int(sizes[i]),
+                   'min': int(mins[i]), 'promedio': round(float(avgs[i]), 3), 'max': int(maxs[i])}
+            row.update({f'p{p}': int(pcts[p][i]) for p in percentiles})
+            rows.append(row)
+        return rows
+    rows = []
+    first = times[0]
+    current, group = None, []
+
+    def close_group():
+        values = sorted(sum(c) for _, c in group)
+        row = {'inicio': group[0][0], 'fin': group[-1][0], 'muestras': len(values), 'min': values[0],
+               'promedio': round(sum(values) / len(values), 3), 'max': values[-1]}
+        row.update({f'p{p}': _percentile_sorted(values, p) for p in percentiles})
+        rows.append(row)
+
+    for ts, c in zip(times, counts):
+        bucket = int((ts - first) // window)
+        if bucket != current and group:
+            close_group()
+            group = []
+        current = bucket
+        group.append((ts, c))
+    if group:
+        close_group()
+    return rows
+
+
+def export_rollup(ring, window, fmt, out):
+    times, counts = ring.read()
+    rows = rollup(times, counts, window)
+    for row in rows:
+        row['inicio_iso'] = datetime.fromtimestamp(row['inicio']).isoformat(timespec='seconds')
+    if fmt == 'json':
+        json.dump({'puertos': ring.ports, 'estado': ring.state, 'ventana': window, 'ventanas': rows}, out, indent=2)
+        out.write('\n')
+        return len(rows)
+    fields = ['inicio_iso', 'inicio', 'fin', 'muestras', 'min', 'promedio', 'max'] + [k for k in (rows[0] if rows else {}) if k[0] == 'p' and k[1:].isdigit()]
+    writer = csv.DictWriter(out, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(rows)
+    return len(rows)
+
+
+class Screen:
+    """Redibuja solo las líneas que cambiaron usando secuencias ANSI"""
+
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.previous = []
+
+    def start(self):
+        self.out.write('\x1b[?25l\x1b[2J')
+        self.previous = []
+
+    def draw(self, lines):
+        parts = []
+        for row, line in enumerate(lines):
+            if row >= len(self.previous) or self.previous[row] != line:
+                parts.append(f'\x1b[{row + 1};1H{line}\x1b[K')
+        # Borra lo que sobra del cuadro anterior
+        for row in range(len(lines), len(self.previous)):
+            parts.append(f'\x1b[{row + 1};1H\x1b[K')
+        if parts:
+            self.out.write(''.join(parts))
+            self.out.flush()
+        self.previous = list(lines)
+
+    def stop(self):
+        self.out.write(f'\x1b[{len(self.previous) + 1};1H\x1b[?25h')
+        self.out.flush()
+
+
 class NetworkMonitor:
-    def __init__(self, port=3333, max_points=50):
-        self.port = port
+    def __init__(self, ports=(3333,), max_points=50, state='ESTABLISHED', sampler=None):
+        self.ports = list(ports)
+        self.port = self.ports[0]
+        self.state = state
         self.max_points = max_points
         self.data = deque([0] * max_points, maxlen=max_points)
         self.max_value = 10
-        
+        self.last_counts = {p: {} for p in self.ports}
+        self.sampler = make_sampler(self.ports) if sampler is None else sampler
+        self.screen = Screen()
+        self.subtitle = None
+
     def get_connections_count(self):
-        """Cuenta las conexiones activas desde el puerto especificado"""
-        count = 0
-        try:
-            connections = psutil.net_connections(kind='inet')
-            for conn in connections:
-                # Verifica si la conexión local es desde nuestro puerto
-                if conn.laddr.port == self.port and conn.status == 'ESTABLISHED':
-                    count += 1
-        except (psutil.AccessDenied, PermissionError):
-            print("\n⚠️  Se requieren permisos de administrador/root")
-            print("Ejecuta con: sudo python3 script.py")
-            sys.exit(1)
-        return count
-    
-    def draw_chart(self):
-        """Dibuja la gráfica en el terminal"""
-        os.system('clear' if os.name != 'nt' else 'cls')
-        
-        print("=" * 60)
-        print(f"  Monitor de Peticiones - Puerto {self.port}")
-        print("=" * 60)
-        print()
-        
+        """Cuenta las conexiones en el estado vigilado sumando todos los puertos"""
+        self.last_counts = self.sampler.sample()
+        return sum(c.get(self.state, 0) for c in self.last_counts.values())
+
+    def render(self):
+        """Construye las líneas de la gráfica"""
+        ports = ', '.join(str(p) for p in self.ports)
+        lines = [
+            "=" * 60,
+            f"  Monitor de Peticiones - Puerto{'s' if len(self.ports) > 1 else ''} {ports} ({self.state})",
+            "=" * 60,
+            self.subtitle or "",
+        ]
+
         # Ajusta el valor máximo dinámicamente
         current_max = max(self.data) if max(self.data) > 0 else 10
         self.max_value = max(self.max_value * 0.9, current_max * 1.2)
-        
+
         # Altura de la gráfica
         height = 15
-        
+
         # Dibuja la gráfica
         for row in range(height, -1, -1):
             threshold = (row / height) * self.max_value
             line = f"{int(threshold):3d} |"
-            
+
             for value in self.data:
                 if value >= threshold:
                     line += "█"
@@ -60,49 +361,215 @@ class NetworkMonitor:
                     line += "▄"
                 else:
                     line += " "
-            
-            print(line)
-        
+
+            lines.append(line)
+
         # Línea base
-        print("    +" + "-" * self.max_points)
-        
+        lines.append("    +" + "-" * self.max_points)
+
         # Estadísticas
         current = self.data[-1]
         avg = sum(self.data) / len(self.data)
         max_val = max(self.data)
-        
-        print()
-        print(f"  🟢 Peticiones actuales: {current}")
-        print(f"  📊 Promedio: {avg:.1f}")
-        print(f"  📈 Máximo: {int(max_val)}")
-        print()
-        print("  Presiona Ctrl+C para detener")
-        
-    def run(self, interval=1):
-        """Ejecuta el monitor"""
-        print(f"Iniciando monitor en puerto {self.port}...")
-        print("Obteniendo permisos...")
-        
+
+        lines += [
+            "",
+            f"  🟢 Peticiones actuales: {current}",
+            f"  📊 Promedio: {avg:.1f}",
+            f"  📈 Máximo: {int(max_val)}",
+            "",
+        ]
+
+        # Desglose por puerto y estado
+        for port in self.ports:
+            counts = self.last_counts.get(port) or {}
+            detail = '  '.join(f"{s}={n}" for s, n in sorted(counts.items(), key=lambda kv: -kv[1])) or 'sin conexiones'
+            lines.append(f"  :{port}  {detail}")
+        lines += ["", self.footer]
+        return lines
+
+    footer = "  Presiona Ctrl+C para detener"
+
+    def draw_chart(self):
+        """Dibuja la gráfica en el terminal"""
+        self.screen.draw(self.render())
+
+    def run(self, interval=1.0, recorder=None, headless=False):
+        """Ejecuta el monitor; con `recorder` guarda cada muestra, con `headless` no dibuja"""
+        print(f"Iniciando monitor en puerto(s) {', '.join(str(p) for p in self.ports)}...")
+        if recorder is not None:
+            print(f"Grabando en {recorder.path} (capacidad {recorder.capacity} muestras)")
+        if not headless:
+            self.screen.start()
+        next_at = time.monotonic()
+        last_flush = next_at
         try:
             while True:
                 count = self.get_connections_count()
                 self.data.append(count)
-                self.draw_chart()
-                time.sleep(interval)
-                
+                if recorder is not None:
+                    recorder.append(time.time(), [self.last_counts[p].get(self.state, 0) for p in self.ports])
+                    if next_at - last_flush >= 10:
+                        recorder.flush()
+                        last_flush = next_at
+                if not headless:
+                    self.draw_chart()
+                # Mantiene el ritmo aunque dibujar tarde: intervalos de menos de un segundo incluidos
+                next_at += interval
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_at = time.monotonic()
+
         except KeyboardInterrupt:
-            print("\n\n✓ Monitor detenido")
+            if not headless:
+                self.screen.stop()
+            self.sampler.close()
+            if recorder is not None:
+                recorder.close()
+            print("\n✓ Monitor detenido")
             sys.exit(0)
 
-if __name__ == "__main__":
-    # Verifica argumentos
-    port = 3333
-    if len(sys.argv) > 1:
-        try:
-            port = int(sys.argv[1])
-        except ValueError:
-            print("Puerto inválido. Uso: python3 script.py [puerto]")
+
+class ReplayViewer:
+    """Reproduce una grabación con la misma gráfica; se controla con el teclado"""
+
+    KEYS = "  ←/→ mover  ⇞/⇟ saltar  espacio pausa  +/- velocidad  inicio/fin  q salir"
+
+    def __init__(self, ring, max_points=50):
+        self.ring = ring
+        self.times, self.counts = ring.read()
+        if np is not None:
+            self.totals = self.counts.sum(axis=1).tolist()
+            self.times = self.times.tolist()
+            self.counts = self.counts.tolist()
+        else:
+            self.totals = [sum(c) for c in self.counts]
+        self.monitor = NetworkMonitor(ports=ring.ports, max_points=max_points, state=ring.state, sampler=False)
+        self.monitor.footer = self.KEYS
+        self.position = min(len(self.times), max_points) - 1
+        self.playing = False
+        self.speed = 1.0
+
+    def render(self):
+        mon = self.monitor
+        end = self.position + 1
+        window = self.totals[max(0, end - mon.max_points):end]
+        mon.data = deque([0] * (mon.max_points - len(window)) + window, maxlen=mon.max_points)
+        counts = self.counts[self.position] if self.times else [0] * len(mon.ports)
+        mon.last_counts = {p: {mon.state: c} for p, c in zip(mon.ports, counts)}
+        when = datetime.fromtimestamp(self.times[self.position]).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] if self.times else '-'
+        status = '▶' if self.playing else '⏸'
+        mon.subtitle = f"  {status} {when}  muestra {self.position + 1}/{len(self.times)}  x{self.speed:g}"
+        return mon.render()
+
+    def move(self, delta):
+        self.position = max(0, min(len(self.times) - 1, self.position + delta))
+
+    def handle(self, key):
+        page = self.monitor.max_points
+        if key in ('q', '\x03'):
+            return False
+        if key == ' ':
+            self.playing = not self.playing
+        elif key in ('\x1b[C', 'l'):
+            self.move(1)
+        elif key in ('\x1b[D', 'h'):
+            self.move(-1)
+        elif key in ('\x1b[6~', '\x1b[B', 'j'):
+            self.move(page)
+        elif key in ('\x1b[5~', '\x1b[A', 'k'):
+            self.move(-page)
+        elif key in ('\x1b[H', 'g'):
+            self.position = 0
+        elif key in ('\x1b[F', 'G'):
+            self.move(len(self.times))
+        elif key == '+':
+            self.speed = min(64.0, self.speed * 2)
+        elif key == '-':
+            self.speed = max(0.125, self.speed / 2)
+        return True
+
+    def run(self):
+        if termios is None or not sys.stdin.isatty():
+            print("⚠️  La reproducción necesita una terminal interactiva (termios)")
             sys.exit(1)
-    
-    monitor = NetworkMonitor(port=port)
-    monitor.run(interval=1)
\ No newline at end of file
+        if not self.times:
+            print("⚠️  La grabación está vacía")
+            sys.exit(1)
+        fd = sys.stdin.fileno()
+        saved = termios.tcgetattr(fd)
+        screen = self.monitor.screen
+        try:
+            tty.setcbreak(fd)
+            screen.start()
+            while True:
+                screen.draw(self.render())
+                timeout = self.ring.interval / self.speed if self.playing else None
+                ready, _, _ = select.select([fd], [], [], timeout)
+                if not ready:
+                    if self.position >= len(self.times) - 1:
+                        self.playing = False
+                    self.move(1)
+                    continue
+                key = os.read(fd, 16).decode('utf-8', 'ignore')
+                if not self.handle(key):
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            termios.tcsetattr(fd, termios.TCSADRAIN, saved)
+            screen.stop()
+            self.ring.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Monitor de conexiones TCP por puerto en tiempo real")
+    parser.add_argument('puertos', nargs='*', type=int, default=[3333], help="puertos locales a vigilar (por defecto 3333)")
+    parser.add_argument('-i', '--intervalo', type=float, default=1.0, help="segundos entre muestras, admite fracciones (ej. 0.25)")
+    parser.add_argument('-e', '--estado', default='ESTABLISHED', type=str.upper,
+                        choices=sorted(set(TCP_STATES.values())), metavar='ESTADO', help="estado TCP que se grafica (ESTABLISHED, TIME_WAIT, ...)")
+    parser.add_argument('-n', '--puntos', type=int, default=50, help="puntos visibles en la gráfica")
+    parser.add_argument('-g', '--grabar', metavar='ARCHIVO', help="guarda cada muestra en un archivo circular")
+    parser.add_argument('--capacidad', type=int, default=259200, help="muestras que guarda el archivo circular (por defecto 3 días a 1/s)")
+    parser.add_argument('--sin-pantalla', action='store_true', help="solo graba, sin dibujar la gráfica")
+    parser.add_argument('-r', '--reproducir', metavar='ARCHIVO', help="reproduce una grabación (flechas para moverse)")
+    parser.add_argument('-x', '--exportar', metavar='ARCHIVO', help="exporta una grabación resumida por ventanas")
+    parser.add_argument('-f', '--formato', choices=('csv', 'json'), default='csv', help="formato de exportación")
+    parser.add_argument('-w', '--ventana', type=float, default=60.0, help="segundos por ventana al exportar")
+    parser.add_argument('-o', '--salida', metavar='ARCHIVO', help="archivo de exportación (por defecto la salida estándar)")
+    args = parser.parse_args(argv)
+    if args.sin_pantalla and not args.grabar:
+        parser.error("--sin-pantalla requiere --grabar")
+    if args.ventana <= 0:
+        parser.error("la ventana debe ser mayor que 0")
+    if args.intervalo <= 0:
+        parser.error("el intervalo debe ser mayor que 0")
+    for port in args.puertos:
+        if not 0 < port < 65536:
+            parser.error(f"Puerto inválido: {port}")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        if args.exportar:
+            ring = RingFile(args.exportar)
+            out = open(args.salida, 'w', newline='') if args.salida else sys.stdout
+            windows = export_rollup(ring, args.ventana, args.formato, out)
+            ring.close()
+            if args.salida:
+                out.close()
+                print(f"✓ {windows} ventanas exportadas a {args.salida}")
+            sys.exit(0)
+        if args.reproducir:
+            ReplayViewer(RingFile(args.reproducir), max_points=args.puntos).run()
+            sys.exit(0)
+        recorder = RingFile(args.grabar, args.puertos, args.estado, args.intervalo, args.capacidad) if args.grabar else None
+        monitor = NetworkMonitor(ports=args.puertos, max_points=args.puntos, state=args.estado)
+    except (RuntimeError, OSError, ValueError) as e:
+        print(f"⚠️  {e}")
+        sys.exit(1)
+    monitor.run(interval=args.intervalo, recorder=recorder, headless=args.sin_pantalla)
@@ -0,0 +1,24 @@
+const http = require('http');
+
+// Fire-and-forget POST al event_emitter (scripts/event_emitter.py)
+const notifyEmitter = (path, body) => {
+  try {
+    const host = (process.env.EMITTER_BIND_HOST && process.env.EMITTER_BIND_HOST !== '0.0.0.0') ? process.env.EMITTER_BIND_HOST : 'localhost';
+    const port = Number(process.env.EMITTER_HTTP_PORT) || 8766;
+    const payload = JSON.stringify(body || {});
+    const req = http.request({ host, port, path, method: 'POST', headers: { 'Content-Type': 'application/json', 'Content-Length': Buffer.byteLength(payload) } }, (res) => { res.resume(); });
+    req.on('error', () => {});
+    req.write(payload);
+    req.end();
+  } catch (e) {}
+};
+
+// Invalida la caché de destinatarios del emisor (sin channelId ni handle invalida todos los canales).
+// channelId puede ser una lista de canales. Con handle, el emisor vuelve a enviar a ese token
+// aunque lo hubiera descartado por inválido.
+const invalidateEmitterRecipients = (channelId, handle) => notifyEmitter('/cache/invalidate', {
+  ...(Array.isArray(channelId) ? { channelIds: channelId } : channelId ? { channelId } : {}),
+  ...(handle ? { handle } : {})
+});
+
+module.exports = { notifyEmitter, invalidateEmitterRecipients };
@@ -3,7 +3,7 @@ const router = express.Router();
 const prisma = require('../config/database');
 const { Prisma } = require('@prisma/client');
 const jwt = require('jsonwebtoken');
-const http = require('http');
+const { notifyEmitter } = require('../config/emitter');
 
 // GET /api/messages/channel/:channelId - Obtener mensajes de un canal (con filtros en backend)
 router.get('/channel/:channelId', async (req, res) => {
@@ -263,13 +263,10 @@ router.post('/', async (req, res) => {
 
     try {
       if (isEmergency) {
-        const host = (process.env.EMITTER_BIND_HOST && process.env.EMITTER_BIND_HOST !== '0.0.0.0') ? process.env.EMITTER_BIND_HOST : 'localhost';
-        const port = Number(process.env.EMITTER_HTTP_PORT) || 8766;
-        const payload = JSON.stringify({ id: full.id, channelId: full.channelId, content: full.content, createdAt: new Date().toISOString(), eventAt: full.eventAt ? new Date(full.eventAt).toISOString() : undefined });
-        const req = http.request({ host, port, path: '/event', method: 'POST', headers: { 'Content-Type': 'application/json', 'Content-Length': Buffer.byteLength(payload) } }, () => {});
-        req.on('error', () => {});
-        req.write(payload);
-        req.end();
+        notifyEmitter('/event', { id: full.id, channelId: full.channelId, content: full.content, createdAt: new Date().toISOString(), eventAt: full.eventAt ? new Date(full.eventAt).toISOString() : undefined, isEmergency: true, priority: full.priority });
+      } else {
+        // Despierta el sondeo del emisor para que lea el mensaje sin esperar su intervalo
+        notifyEmitter('/poll/wake');
       }
     } catch (e) {}
 
@@ -1,6 +1,7 @@
 const express = require('express');
 const router = express.Router();
 const prisma = require('../config/database');
+const { invalidateEmitterRecipients } = require('../config/emitter');
 
 // POST /api/subscriptions - Suscribirse a un canal
 router.post('/', async (req, res) => {
@@ -23,6 +24,7 @@ router.post('/', async (req, res) => {
         where: { id: existingSubscription.id },
         data: { isActive: true }
       });
+      invalidateEmitterRecipients(channelId);
 
       return res.json({ 
         message: 'Suscripción reactivada',
@@ -44,6 +46,8 @@ router.post('/', async (req, res) => {
       }
     });
 
+    invalidateEmitterRecipients(channelId);
+
     // Incrementar contador de miembros
     await prisma.channel.update({
       where: { id: channelId },
@@ -91,6 +95,7 @@ router.delete('/', async (req, res) => {
       where: { id: subscription.id },
       data: { isActive: false }
     });
+    invalidateEmitterRecipients(channelId);
 
     // Decrementar contador de miembros
     await prisma.channel.update({
@@ -171,6 +176,7 @@ router.patch('/preferences/receive', async (req, res) => {
       where: { id: sub.id },
       data: { receiveMessages: !!receive }
     });
+    invalidateEmitterRecipients(channelId);
     res.json(updated);
   } catch (error) {
     res.status(500).json({ error: 'Error actualizando recepción' });
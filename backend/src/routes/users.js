@@ -1,6 +1,7 @@
 const express = require('express');
 const router = express.Router();
 const prisma = require('../config/database');
+const { invalidateEmitterRecipients } = require('../config/emitter');
 const jwt = require('jsonwebtoken');
 // GET /api/users - Listar usuarios con métricas
 router.get('/', async (req, res) => {
@@ -489,15 +490,28 @@ router.post('/', async (req, res) => {
 });
 
 module.exports = router;
+// Reactiva el handle en el emisor e invalida solo los canales a los que está suscrito el usuario
+const invalidateUserRecipients = async (userId, handle) => {
+  try {
+    const subs = await prisma.channelSubscription.findMany({ where: { userId, isActive: true }, select: { channelId: true } });
+    invalidateEmitterRecipients(subs.map(s => s.channelId), handle);
+  } catch (e) {
+    // Sin la lista de canales, invalidar todo es preferible a dejar el handle anterior en caché
+    invalidateEmitterRecipients(null, handle);
+  }
+};
+
 router.post('/:id/messaging-settings', async (req, res) => {
   try {
     const { id } = req.params;
     const { platform, handle } = req.body;
     const setting = await prisma.userMessagingSetting.upsert({
       where: { userId_platform: { userId: id, platform } },
-      update: { handle: handle || null },
+      // Re-registrar un handle lo reactiva si el emisor lo deshabilitó por inválido
+      update: { handle: handle || null, ...(handle ? { isEnabled: true } : {}) },
       create: { userId: id, platform, handle: handle || null }
     });
+    if (platform === 'PUSH') await invalidateUserRecipients(id, handle);
     res.status(201).json(setting);
   } catch (error) {
     res.status(500).json({ error: 'Error configurando plataforma' });
@@ -510,8 +524,9 @@ router.put('/:id/messaging-settings/:platform', async (req, res) => {
     const { handle, verified } = req.body;
     const setting = await prisma.userMessagingSetting.update({
       where: { userId_platform: { userId: id, platform } },
-      data: { handle: handle || null, verified }
+      data: { handle: handle || null, verified, ...(handle ? { isEnabled: true } : {}) }
     });
+    if (platform === 'PUSH') await invalidateUserRecipients(id, handle);
     res.json(setting);
   } catch (error) {
     res.status(500).json({ error: 'Error actualizando plataforma' });